@@ -1,25 +1,202 @@
 # Importing the necessary libraries
+# (folium, plotly.express and pydeck are only needed by the City search and Stations pages,
+# so they are imported inside the functions which use them, and the other pages don't pay for loading them)
 import streamlit as st
 import pandas as pd
-from urllib.request import urlopen
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.metrics.pairwise import euclidean_distances
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 from streamlit_option_menu import option_menu
+import functools
 import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from streamlit_lottie import st_lottie
-import pydeck as pdk
-import snowflake.connector
-import folium
-from streamlit_folium import folium_static
 
 # Initializing empty DataFrames
 df_air_quality = None
 df_air_quality_forecast = None
 
+# WAQI API settings (both can be overridden with environment variables, e.g. to point the app at a local stub server)
+WAQI_BASE_URL = os.environ.get("WAQI_BASE_URL", "https://api.waqi.info/")
+WAQI_TOKEN = os.environ.get("WAQI_TOKEN", "136f8d87c3aa5d2a7a6fe9b84cb80ac79abf0adf")
+
+# Initializing the per-render feed store:
+# - city_feeds keeps the parsed WAQI response for every city requested during the current render,
+# - network_calls counts how many requests were actually sent to the WAQI API during the current render
+#   (see count_network_call(); the "All cities" overview sends them from several threads, so it is guarded by network_calls_lock).
+# Streamlit re-executes the whole script on every interaction, so both start empty for every render.
+city_feeds = {}
+network_calls = 0
+network_calls_lock = threading.Lock()
+
+# Render profiling settings:
+# - AQI_PROFILE=1 shows how long every stage of the City search render took (in a "Render profile" expander) and prints it as a log line,
+# - AQI_PROFILE_LOG: path of a JSON lines file to which the profile of every render is appended (e.g. to compute p50/p95 across sessions).
+AQI_PROFILE = os.environ.get("AQI_PROFILE", "0") == "1"
+AQI_PROFILE_LOG = os.environ.get("AQI_PROFILE_LOG", "")
+
+# Initializing the per-render profile: when the render started and the (stage, seconds) pairs recorded by timed_stage()
+render_started = time.perf_counter()
+render_timings = []
+render_metrics = {}  # other per-render measurements, e.g. the size of the map HTML sent to the browser
+render_scope = "full"  # "full" when the whole script runs, "fragment" when only a page fragment reruns (see page_fragment below)
+
+# WAQI feed cache settings (in seconds / number of entries):
+# - WAQI_CACHE_TTL: how long a response is considered fresh (WAQI stations update hourly),
+# - WAQI_CACHE_STALE_TTL: how long after that a stale response is still served while it is being refreshed in the background,
+# - WAQI_CACHE_SIZE: how many cities/stations are kept before the least recently used one is evicted.
+WAQI_CACHE_TTL = int(os.environ.get("WAQI_CACHE_TTL", 3600))
+WAQI_CACHE_STALE_TTL = int(os.environ.get("WAQI_CACHE_STALE_TTL", 3600))
+WAQI_CACHE_SIZE = int(os.environ.get("WAQI_CACHE_SIZE", 256))
+
+# WAQI HTTP client settings:
+# - WAQI_CONNECT_TIMEOUT / WAQI_READ_TIMEOUT: how long (in seconds) to wait for the connection and for the response,
+# - WAQI_MAX_RETRIES: how many times a request answered with 429 or 5xx is retried,
+# - WAQI_MAX_CONNECTIONS: how many requests may be sent to one host at the same time (also the size of the connection pool).
+WAQI_CONNECT_TIMEOUT = float(os.environ.get("WAQI_CONNECT_TIMEOUT", 3.05))
+WAQI_READ_TIMEOUT = float(os.environ.get("WAQI_READ_TIMEOUT", 10))
+WAQI_MAX_RETRIES = int(os.environ.get("WAQI_MAX_RETRIES", 2))
+WAQI_MAX_CONNECTIONS = int(os.environ.get("WAQI_MAX_CONNECTIONS", 8))
+# How long (in seconds) the "All cities" overview waits for all cities before showing the ones which have already answered
+WAQI_BATCH_TIMEOUT = float(os.environ.get("WAQI_BATCH_TIMEOUT", 30))
+
+# Record/replay settings (see waqi_replay.py and loadtest.py):
+# - WAQI_HTTP_MODE: "live" sends the requests to the WAQI API, "record" also saves every successful response as a fixture,
+#   "replay" answers the requests from the saved fixtures without touching the network (no token needed),
+# - WAQI_FIXTURES_DIR: the directory in which the fixtures are kept,
+# - WAQI_REPLAY_LATENCY / WAQI_REPLAY_ERROR_RATE / WAQI_REPLAY_PADDING: the mean latency (in seconds) of a replayed response,
+#   the share of replayed requests answered with 503, and the number of bytes added to every replayed response.
+WAQI_HTTP_MODE = os.environ.get("WAQI_HTTP_MODE", "live")
+WAQI_FIXTURES_DIR = os.environ.get("WAQI_FIXTURES_DIR", "waqi_fixtures")
+WAQI_REPLAY_LATENCY = float(os.environ.get("WAQI_REPLAY_LATENCY", 0))
+WAQI_REPLAY_ERROR_RATE = float(os.environ.get("WAQI_REPLAY_ERROR_RATE", 0))
+WAQI_REPLAY_PADDING = int(os.environ.get("WAQI_REPLAY_PADDING", 0))
+
+# Background poller settings:
+# - WAQI_POLLER=1 turns on a background thread which keeps the feed cache warm (see FeedPoller below),
+# - WAQI_POLL_INTERVAL: how often (in seconds) every city is refreshed; it should be shorter than WAQI_CACHE_TTL,
+# - WAQI_POLL_RECENT_SIZE: how many recently requested custom cities are refreshed as well.
+WAQI_POLLER = os.environ.get("WAQI_POLLER", "0") == "1"
+WAQI_POLL_INTERVAL = float(os.environ.get("WAQI_POLL_INTERVAL", 900))
+WAQI_POLL_RECENT_SIZE = int(os.environ.get("WAQI_POLL_RECENT_SIZE", 20))
+
+# History store settings:
+# - WAQI_HISTORY_DB: path of the SQLite file in which every fetched reading is kept (an empty value turns the history off),
+# - WAQI_HISTORY_DAYS: how many days of readings are kept when the store is compacted,
+# - WAQI_HISTORY_COMPACT_INTERVAL: how often (in seconds) the store is compacted by a background thread,
+# - WAQI_HISTORY_BUSY_TIMEOUT: how long (in seconds) a render waits for the store to be unlocked before it gives up saving a reading.
+WAQI_HISTORY_DB = os.environ.get("WAQI_HISTORY_DB", "aqi_history.sqlite3")
+WAQI_HISTORY_DAYS = int(os.environ.get("WAQI_HISTORY_DAYS", 365))
+WAQI_HISTORY_COMPACT_INTERVAL = float(os.environ.get("WAQI_HISTORY_COMPACT_INTERVAL", 86400))
+WAQI_HISTORY_BUSY_TIMEOUT = float(os.environ.get("WAQI_HISTORY_BUSY_TIMEOUT", 0.5))
+
+# Stations map settings:
+# - STATIONS_MAX_POINTS: the most points sent to the browser; when more stations are in view, nearby stations are merged into clusters,
+# - STATION_REGIONS: the regions (south, west, north, east) offered in the Stations page and their initial zoom level.
+STATIONS_MAX_POINTS = int(os.environ.get("STATIONS_MAX_POINTS", 2000))
+STATION_REGIONS = {
+    "Poland": ((49.0, 14.1, 54.9, 24.2), 5),
+    "Europe": ((35.0, -11.0, 71.0, 40.0), 3),
+    "World": ((-60.0, -180.0, 75.0, 180.0), 1),
+}
+
+# Custom city resolver settings:
+# - WAQI_NEGATIVE_TTL: for how long (in seconds) a name which the WAQI API didn't recognize is answered from memory instead of being requested again,
+# - CITY_MATCH_THRESHOLD: how similar (0-1, see CityResolver) a misspelled name has to be to a known name to be replaced by it,
+# - CITY_RESOLVER_SIZE: how many custom city names (and how many names which the API didn't recognize) are remembered.
+WAQI_NEGATIVE_TTL = float(os.environ.get("WAQI_NEGATIVE_TTL", 600))
+CITY_MATCH_THRESHOLD = float(os.environ.get("CITY_MATCH_THRESHOLD", 0.5))
+CITY_RESOLVER_SIZE = int(os.environ.get("CITY_RESOLVER_SIZE", 1000))
+
+# Defining the pages of the app; AQI_DEFAULT_PAGE chooses the page shown first (e.g. "City search" for load tests)
+PAGES = ["Welcome", 'City search', 'Stations', 'About']
+AQI_DEFAULT_PAGE = os.environ.get("AQI_DEFAULT_PAGE", "Welcome")
+
+# Defining the list of cities offered in the City search page
+CITIES = ["Szczecin", "Bydgoszcz", "Torun", "Lublin", "Gorzow Wielkopolski", "Zielona Gora", "Lodz", "Krakow", "Wroclaw", "Opole", "Rzeszow", "Bialystok", "Gdansk", "Katowice", "Kielce", "Poznan", "Warszawa"]
+
+# Defining a decorator which measures how long the decorated function takes and records it in render_timings under the given stage name
+def timed_stage(stage):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                render_timings.append((stage, time.perf_counter() - started))
+        return wrapper
+    return decorator
+
+# Defining a function which reports the profile of the current render (only if AQI_PROFILE or AQI_PROFILE_LOG is set):
+# the total time since the script started, the number of WAQI requests and the time spent in every stage (summed up, with the number of calls).
+# Stages run in parallel (e.g. the network requests of the "All cities" overview) can add up to more than the total time.
+def report_render_profile(page):
+    if not (AQI_PROFILE or AQI_PROFILE_LOG):
+        return
+    stages = {}
+    for stage, seconds in render_timings:
+        total_seconds, calls = stages.get(stage, (0.0, 0))
+        stages[stage] = (total_seconds + seconds, calls + 1)
+    profile = {
+        "time": round(time.time(), 3),
+        "page": page,
+        "rerun": render_scope,
+        "total_s": round(time.perf_counter() - render_started, 4),
+        "network_calls": network_calls,
+        "stages": {stage: {"s": round(seconds, 4), "calls": calls} for stage, (seconds, calls) in stages.items()},
+        **render_metrics,
+    }
+
+    if AQI_PROFILE_LOG:
+        with open(AQI_PROFILE_LOG, "a") as f:
+            f.write(json.dumps(profile) + "\n")
+    if AQI_PROFILE:
+        print(f"Render profile: {json.dumps(profile)}")
+        with st.expander('Render profile'):
+            st.write(f"Total: {profile['total_s']} s, WAQI requests: {network_calls}, other measurements: {render_metrics}")
+            st.dataframe(pd.DataFrame.from_dict(profile["stages"], orient='index'))
+
+# Starting a new render for a fragment rerun: a full rerun resets the feed store and the profile by re-executing the top of the script,
+# a fragment rerun only calls the fragment function (which still sees the module state left by the previous run), so it resets them here.
+def start_fragment_render():
+    global city_feeds, network_calls, render_started, render_timings, render_metrics, render_scope
+    city_feeds = {}
+    network_calls = 0
+    render_started = time.perf_counter()
+    render_timings = []
+    render_metrics = {}
+    render_scope = "fragment"
+
+# Defining a decorator which turns a page into a Streamlit fragment: a widget inside the page reruns only the page function,
+# not the whole script, so the sidebar (with its Lottie animation) and the rest of the app aren't re-executed and re-sent to the browser.
+# On Streamlit versions without fragments the page simply reruns with the whole script, as before.
+def page_fragment(function):
+    make_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if make_fragment is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        global render_scope
+        # After the page has run once in this script run, every later call of it is a fragment rerun
+        if render_scope == "fragment":
+            start_fragment_render()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            render_scope = "fragment"
+    return make_fragment(wrapper)
+
 # Setting up the initial look of the web page:
 # - its title to "Air quality around the World", 
 # - layout to "wide", so that the content spans the entire width of the page, 
@@ -48,13 +225,14 @@ def load_lottiefile(filepath: str):
 
 # Options Menu
 # Specifying the contents of the Streamlit sidebar:
-# - options "Welcome," "City search," and "About."
-# - icons for each option: 'sun', 'map', 'info-circle'
+# - options "Welcome," "City search," "Stations," and "About."
+# - icons for each option: 'sun', 'map', 'geo-alt', 'info-circle'
 # - icon for the menu itself: 'cloud' 
-# - the default_index parameter sets the default selected index to 0 (the "Welcome" option)
+# - the default_index parameter sets the page selected at start (the "Welcome" option, unless AQI_DEFAULT_PAGE says otherwise)
 with st.sidebar:
-    selected = option_menu('AQI - World', ["Welcome", 'City search','About'], 
-        icons=['sun', 'map', 'info-circle'],menu_icon='cloud', default_index=0)
+    selected = option_menu('AQI - World', PAGES, 
+        icons=['sun', 'map', 'geo-alt', 'info-circle'],menu_icon='cloud',
+        default_index=PAGES.index(AQI_DEFAULT_PAGE) if AQI_DEFAULT_PAGE in PAGES else 0)
     # Loading a file containing animation properties into 'lottie' variable:
     lottie = load_lottiefile("similo3.json")
     # Displaying the Lottie animation
@@ -112,48 +290,733 @@ if selected=="Welcome":
  # Setting up the Search page pt. 1
  
 # But in the meantime ...
-# Defining a function whose purpose is to simplify the structure of a nested dictionary (from the API)
-# The function takes four parameters:
-# - d: The input dictionary to be flattened.
-# - parent_key='': A string representing the current parent key. It is used for concatenating keys.
-# - sep='_': The separator used when concatenating keys.
-# - exclude_keys=None: A list of keys to be excluded from the flattened dictionary.
-
-
-def flatten_dict(d, parent_key='', sep='_', exclude_keys=None):
-    if exclude_keys is None:
-        exclude_keys = []
-# - It initializes an empty list called items to store key-value pairs of the flattened dictionary.
-    items = []
-    if isinstance(d, dict):
-        # k - key
-        # v - value
-        for k, v in d.items():
-            new_key = f'{parent_key}{sep}{k}' if parent_key else k
-            # - It checks if the current value (v) is a dictionary. If so, it recursively calls flatten_dict on the nested dictionary.
-            if isinstance(v, dict):
-                items.extend(flatten_dict(v, new_key, sep=sep, exclude_keys=exclude_keys).items())
-            # - If the value is not a dictionary, it appends a key-value pair to the items list. 
-            # - If the key is not in the exclude_keys, it appends the pair; otherwise, it is skipped.
-            elif new_key not in exclude_keys:
-                items.append((new_key, v))
+# Defining the columns of the air quality DataFrame and where their values are found in the 'data' part of the WAQI response
+# (e.g. ('iaqi', 'pm25', 'v') stands for data['iaqi']['pm25']['v']). Everything else in the response (attributions, forecast, debug info, ...) is skipped.
+AIR_QUALITY_SCHEMA = {
+    'AQI': ('aqi',),
+    'Station_id': ('idx',),
+    'Station_lat/long': ('city', 'geo'),
+    'Dominent_pollutant': ('dominentpol',),
+    'Carbon_Monoxyde': ('iaqi', 'co', 'v'),
+    'Relative_Humidity': ('iaqi', 'h', 'v'),
+    'Nitrogen_Dioxide': ('iaqi', 'no2', 'v'),
+    'Ozone': ('iaqi', 'o3', 'v'),
+    'Atmospheric_Pressure': ('iaqi', 'p', 'v'),
+    'Particulate_Matter_(10µm)': ('iaqi', 'pm10', 'v'),
+    'Particulate_Matter_(2.5µm)': ('iaqi', 'pm25', 'v'),
+    'Sulphur_Dioxide': ('iaqi', 'so2', 'v'),
+    'Temperature': ('iaqi', 't', 'v'),
+    'Wind': ('iaqi', 'w', 'v'),
+    'Dew': ('iaqi', 'dew', 'v'),
+    'Rain_(precipitation)': ('iaqi', 'r', 'v'),
+    'Local_measurement_time': ('time', 's'),
+}
+
+# Defining a flattener which turns WAQI responses into the air quality DataFrame (one row per location, indexed by 'city').
+# The schema is compiled once (into a list of column names and their paths), and the responses are then processed in a single pass:
+# every value is appended straight to the list of its column, so no intermediate dictionaries, renaming or dropping of columns are needed.
+# - Columns listed in exclude_columns are never extracted.
+# - Values from the 'iaqi' part which aren't in the schema (e.g. 'wg' - wind gust) are kept in 'iaqi_<key>_v' columns, after the schema columns, sorted by name.
+# - Columns which have no value for any location are left out (like when the responses were flattened one by one),
+#   and responses without data (e.g. for an unknown city) are skipped.
+class FeedFlattener:
+    def __init__(self, schema, exclude_columns=()):
+        self.exclude_columns = frozenset(exclude_columns)
+        self.columns = [column for column in schema if column not in self.exclude_columns]
+        self.paths = [schema[column] for column in self.columns]
+        self.iaqi_keys = frozenset(path[1] for path in schema.values() if path[0] == 'iaqi')
+
+    @timed_stage("dataframe")
+    def __call__(self, locations, results):
+        index = []
+        values = [[] for _ in self.columns]
+        extra_values = {}  # column of an unknown 'iaqi' key -> its values
+
+        for location, result in zip(locations, results):
+            data = result.get('data') if isinstance(result, dict) else None
+            if not isinstance(data, dict):
+                continue
+            for column_values, path in zip(values, self.paths):
+                value = data
+                for key in path:
+                    value = value.get(key) if isinstance(value, dict) else None
+                column_values.append(value)
+            for key, value in data.get('iaqi', {}).items():
+                if key not in self.iaqi_keys:
+                    column = f'iaqi_{key}_v'
+                    if column not in self.exclude_columns:
+                        # Filling in the rows of the locations which didn't have the key
+                        extra_values.setdefault(column, [None] * len(index)).append(value.get('v') if isinstance(value, dict) else None)
+            index.append(str(location))
+            for column_values in extra_values.values():
+                column_values.extend([None] * (len(index) - len(column_values)))
+
+        if not index:
+            return pd.DataFrame()
+        columns = dict(zip(self.columns, values))
+        columns.update(sorted(extra_values.items()))
+        df_locations = pd.DataFrame(columns, index=pd.Index(index, name='city'))
+        return df_locations.dropna(axis=1, how='all')
+
+# Defining an HTTP client for the WAQI API which is shared by all sessions (see get_waqi_client() below).
+# - It keeps the connections open (keep-alive) in a pool, so consecutive requests don't pay for a new TCP + TLS handshake.
+# - Every request has a connect and a read timeout, so a slow API can't block the app forever.
+# - Requests answered with 429 or 5xx are retried up to max_retries times, waiting a random (jittered), exponentially growing time in between.
+#   Retries are also limited by a budget (every request, successful or not, adds 0.1 retry, up to 10; every retry takes 1),
+#   so that a failing API isn't flooded with retries, while the budget refills as soon as requests go through again.
+# - At most max_connections requests are sent to one host at the same time.
+# - The transport can be replaced with another requests adapter (e.g. the record/replay adapters from waqi_replay.py).
+class WaqiClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, connect_timeout, read_timeout, max_retries, max_connections, adapter=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.session = requests.Session()
+        adapter = adapter or HTTPAdapter(pool_connections=4, pool_maxsize=max_connections, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._host_slots = {}  # host -> threading.BoundedSemaphore
+        self._retry_budget = 10.0
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        slots = self._slots_for(urlsplit(url).netloc)
+        with self._lock:
+            self._retry_budget = min(self._retry_budget + 0.1, 10.0)
+        attempt = 0
+        while True:
+            with slots:
+                response = self.session.get(url, timeout=self.timeout)
+            if response.status_code not in self.RETRY_STATUSES or not self._can_retry(attempt):
+                return response
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def _slots_for(self, host):
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_connections)
+            return self._host_slots[host]
+
+    def _can_retry(self, attempt):
+        with self._lock:
+            if attempt >= self.max_retries or self._retry_budget < 1:
+                return False
+            self._retry_budget -= 1
+            return True
+
+    # Using the Retry-After header if the API sent one, otherwise "full jitter" exponential backoff (at most 8 seconds)
+    def _backoff(self, attempt, response):
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(int(retry_after), 8)
+        return random.uniform(0, min(0.5 * 2 ** attempt, 8))
+
+# Creating the HTTP client once per process, so that its connection pool is reused across reruns and sessions
+# (in the "record" and "replay" modes, with the matching adapter from waqi_replay.py)
+@st.cache_resource
+def get_waqi_client():
+    adapter = None
+    if WAQI_HTTP_MODE == "replay":
+        from waqi_replay import ReplayAdapter
+        adapter = ReplayAdapter(WAQI_FIXTURES_DIR, WAQI_REPLAY_LATENCY, WAQI_REPLAY_ERROR_RATE, WAQI_REPLAY_PADDING)
+    elif WAQI_HTTP_MODE == "record":
+        from waqi_replay import RecordingAdapter
+        adapter = RecordingAdapter(WAQI_FIXTURES_DIR, pool_connections=4, pool_maxsize=WAQI_MAX_CONNECTIONS, pool_block=True)
+    return WaqiClient(WAQI_CONNECT_TIMEOUT, WAQI_READ_TIMEOUT, WAQI_MAX_RETRIES, WAQI_MAX_CONNECTIONS, adapter)
+
+# Defining an append-only store of the readings fetched from the WAQI API, kept in a local SQLite file (see get_history_store() below).
+# - Readings are keyed by the station id and the local measurement time; a reading which is already stored is ignored,
+#   so fetching the same (not yet updated) station again doesn't create duplicates. The station's UTC offset is kept next to the local time.
+# - The table is clustered on that key (WITHOUT ROWID), so "the last N days of station X" is a single range scan.
+# - compact() removes readings older than keep_days in small batches (each one a short transaction of its own, so that an append
+#   never waits long for the write lock) and gives the freed pages back to the file system with an incremental vacuum;
+#   start_compaction() runs it periodically in a background thread, so that it never runs inside a render.
+# - Files created before the incremental vacuum was turned on keep their size (the freed pages are reused by new readings);
+#   running VACUUM on such a file once, while the app is stopped, converts it.
+# - The stations seen so far (id, name and coordinates) are kept in a separate table, from which the station index is rebuilt after a restart (see StationIndex).
+class HistoryStore:
+    # Column in the readings table -> the pollutant/weather key in the 'iaqi' part of the WAQI response
+    IAQI_COLUMNS = {'co': 'co', 'h': 'h', 'no2': 'no2', 'o3': 'o3', 'p': 'p', 'pm10': 'pm10', 'pm25': 'pm25',
+                    'so2': 'so2', 't': 't', 'w': 'w', 'dew': 'dew', 'r': 'r'}
+    # Column in the readings table -> column name used in the app's DataFrames (see AIR_QUALITY_SCHEMA)
+    DISPLAY_NAMES = {'station_id': 'Station_id', 'measured_at': 'Local_measurement_time', 'aqi': 'AQI',
+                     'dominant_pollutant': 'Dominent_pollutant', 'co': 'Carbon_Monoxyde', 'h': 'Relative_Humidity',
+                     'no2': 'Nitrogen_Dioxide', 'o3': 'Ozone', 'p': 'Atmospheric_Pressure', 'pm10': 'Particulate_Matter_(10µm)',
+                     'pm25': 'Particulate_Matter_(2.5µm)', 'so2': 'Sulphur_Dioxide', 't': 'Temperature', 'w': 'Wind',
+                     'dew': 'Dew', 'r': 'Rain_(precipitation)', 'utc_offset': 'UTC_offset_(min)'}
+    # UTC offset (in minutes) assumed for readings stored without one: the westernmost time zone, so that compact() never removes them too early
+    UNKNOWN_UTC_OFFSET = -720
+
+    # Number of readings removed by one DELETE in compact() and number of pages given back by one incremental vacuum step
+    COMPACT_BATCH_SIZE = 500
+    VACUUM_STEP_PAGES = 1000
+
+    # busy_timeout: how long (in seconds) a write waits for another connection (e.g. the compactor's) to release the write lock
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._columns = ['station_id', 'measured_at', 'city', 'lat', 'lon', 'aqi', 'dominant_pollutant', *self.IAQI_COLUMNS, 'utc_offset']
+        with self._lock:
+            # auto_vacuum has to be set before the journal mode and the tables, it is ignored for files which already have tables
+            self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(f"""
+                CREATE TABLE IF NOT EXISTS readings (
+                    station_id INTEGER NOT NULL,
+                    measured_at TEXT NOT NULL,
+                    city TEXT,
+                    lat REAL,
+                    lon REAL,
+                    aqi REAL,
+                    dominant_pollutant TEXT,
+                    {", ".join(f"{column} REAL" for column in self.IAQI_COLUMNS)},
+                    utc_offset INTEGER,
+                    PRIMARY KEY (station_id, measured_at)
+                ) WITHOUT ROWID""")
+            # Adding the UTC offset column to stores created before it existed
+            if 'utc_offset' not in [column[1] for column in self._connection.execute("PRAGMA table_info(readings)")]:
+                self._connection.execute("ALTER TABLE readings ADD COLUMN utc_offset INTEGER")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS stations (
+                    station_id INTEGER PRIMARY KEY,
+                    name TEXT,
+                    lat REAL NOT NULL,
+                    lon REAL NOT NULL
+                )""")
+
+    # Adding readings given as (city, WAQI response) pairs in one transaction
+    def append(self, readings):
+        rows = [row for row in (self._to_row(city, payload) for city, payload in readings) if row is not None]
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * len(self._columns))
+        with self._lock:
+            with self._connection:
+                self._connection.execute("BEGIN")
+                cursor = self._connection.executemany(
+                    f"INSERT OR IGNORE INTO readings ({', '.join(self._columns)}) VALUES ({placeholders})", rows)
+        return cursor.rowcount
+
+    # Returning the readings of a station from the last `days` days (counted back from its latest reading), the oldest first
+    def query(self, station_id, days=7):
+        with self._lock:
+            return pd.read_sql_query(
+                """SELECT * FROM readings
+                   WHERE station_id = :station_id
+                     AND measured_at >= datetime((SELECT max(measured_at) FROM readings WHERE station_id = :station_id), :since)
+                   ORDER BY measured_at""",
+                self._connection, params={"station_id": int(station_id), "since": f"-{days} days"}
+            ).rename(columns=self.DISPLAY_NAMES)
+
+    # Adding (or updating) stations given as (station id, name, latitude, longitude) tuples
+    def save_stations(self, stations):
+        with self._lock:
+            with self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.executemany("INSERT OR REPLACE INTO stations (station_id, name, lat, lon) VALUES (?, ?, ?, ?)", stations)
+
+    def load_stations(self):
+        with self._lock:
+            return self._connection.execute("SELECT station_id, name, lat, lon FROM stations").fetchall()
+
+    # Removing the readings older than keep_days; measured_at is the station's local time, so it is turned into UTC before comparing it with 'now'.
+    # The readings are removed station by station in batches of at most batch_size rows, each in its own (autocommitted) transaction:
+    # every batch is a range scan of the (station_id, measured_at) key, bounded by the latest local time which can still be too old (UTC+14).
+    def compact(self, keep_days, batch_size=COMPACT_BATCH_SIZE):
+        with self._lock:
+            cutoff, latest_local = self._connection.execute(
+                "SELECT datetime('now', :since), datetime('now', :since, '+14 hours')", {'since': f"-{keep_days} days"}).fetchone()
+            station_ids = [row[0] for row in self._connection.execute("SELECT DISTINCT station_id FROM readings")]
+        removed = 0
+        for station_id in station_ids:
+            while True:
+                with self._lock:
+                    batch = self._connection.execute(
+                        """DELETE FROM readings WHERE station_id = :station_id AND measured_at IN (
+                               SELECT measured_at FROM readings
+                               WHERE station_id = :station_id AND measured_at < :latest_local
+                                 AND datetime(measured_at, -coalesce(utc_offset, :unknown) || ' minutes') < :cutoff
+                               LIMIT :batch_size)""",
+                        {'station_id': station_id, 'latest_local': latest_local, 'unknown': self.UNKNOWN_UTC_OFFSET,
+                         'cutoff': cutoff, 'batch_size': batch_size}).rowcount
+                removed += batch
+                if batch < batch_size:
+                    break
+        with self._lock:
+            # Giving the freed pages back in small steps too (only possible for files created with auto_vacuum=INCREMENTAL, see above)
+            if removed > 0 and self._connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                while self._connection.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+                    # executescript() runs the pragma to the end, execute() would stop it after the first page
+                    self._connection.executescript(f"PRAGMA incremental_vacuum({self.VACUUM_STEP_PAGES});")
+            self._connection.execute("PRAGMA optimize")
+        return removed
+
+    # Compacting the store every `interval` seconds in a background thread, on a connection of its own
+    # (so that the renders, which append readings, don't wait for this store's lock while the readings are being removed)
+    def start_compaction(self, keep_days, interval):
+        def run():
+            compactor = HistoryStore(self.path)
+            while True:
+                try:
+                    removed = compactor.compact(keep_days)
+                    if removed:
+                        print(f"History store: removed {removed} readings older than {keep_days} days")
+                except sqlite3.Error as e:
+                    print(f"Error: {e} while compacting the history store")
+                time.sleep(interval)
+        threading.Thread(target=run, name="history-compactor", daemon=True).start()
+        return self
+
+    def _to_row(self, city, payload):
+        data = payload.get('data') if isinstance(payload, dict) else None
+        if not isinstance(data, dict) or not isinstance(data.get('idx'), int) or 's' not in data.get('time', {}):
+            return None
+        geo = data.get('city', {}).get('geo') or [None, None]
+        iaqi = data.get('iaqi', {})
+        aqi = data.get('aqi')
+        return (data['idx'], data['time']['s'], city, geo[0], geo[1],
+                aqi if isinstance(aqi, (int, float)) else None, data.get('dominentpol'),
+                *(iaqi.get(key, {}).get('v') for key in self.IAQI_COLUMNS.values()),
+                self._utc_offset(data['time'].get('tz')))
+
+    # Turning the time zone of a WAQI reading (e.g. "+02:00" or "-05:30") into its UTC offset in minutes (None if it isn't given)
+    @staticmethod
+    def _utc_offset(tz):
+        try:
+            hours, minutes = tz[1:].split(':')
+            return (-1 if tz[0] == '-' else 1) * (int(hours) * 60 + int(minutes))
+        except (TypeError, ValueError, IndexError):
+            return None
+
+# Opening the history store once per process and starting its periodic compaction (only if it is turned on with WAQI_HISTORY_DB)
+@st.cache_resource
+def get_history_store():
+    # The readings are appended during renders, which shouldn't wait long for the compactor (a reading which can't be saved in time is skipped)
+    return HistoryStore(WAQI_HISTORY_DB, busy_timeout=WAQI_HISTORY_BUSY_TIMEOUT).start_compaction(WAQI_HISTORY_DAYS, WAQI_HISTORY_COMPACT_INTERVAL)
+
+# Defining the compact in-memory record of a station's reading, used to keep the readings of many stations in memory
+# (the station map responses in the feed cache and the latest reading of every station, see ReadingTable below).
+# Every reading is one row of a NumPy structured array (73 bytes): the station id, the local measurement time,
+# the coordinates, the AQI and the 'iaqi' values as 32-bit floats (missing values are NaN) and the dominant pollutant as a one-byte code.
+# Readings are turned into a DataFrame (with the app's column names) only when they are displayed, see readings_frame().
+READING_POLLUTANTS = ['', 'pm25', 'pm10', 'o3', 'no2', 'so2', 'co']  # dominant pollutant code -> its name ('' when unknown)
+READING_POLLUTANT_CODES = {pollutant: code for code, pollutant in enumerate(READING_POLLUTANTS)}
+READING_DTYPE = np.dtype([
+    ('station_id', '<i4'),
+    ('measured_at', '<M8[s]'),
+    ('lat', '<f4'),
+    ('lon', '<f4'),
+    ('aqi', '<f4'),
+    ('dominant_pollutant', 'u1'),
+    *((column, '<f4') for column in HistoryStore.IAQI_COLUMNS),
+])
+
+# Defining a function which returns a number given as a number or as text (the map API sends the AQI as text, "-" when there is none), otherwise None
+def to_number(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+# Defining a function which builds reading records from WAQI responses: city feeds ('data' is a dict) or map API responses ('data' is a list of stations).
+# The stations of all the responses are collected first and the records are then filled column by column, so a batch of responses costs
+# one NumPy conversion per column. The measurement time is kept as the local time (without the time zone), like in the history store.
+def build_readings(payloads):
+    stations = []
+    for payload in payloads:
+        data = payload.get('data') if isinstance(payload, dict) else None
+        if isinstance(data, dict):
+            geo = data.get('city', {}).get('geo') or [None, None]
+            iaqi = data.get('iaqi', {})
+            stations.append((data.get('idx'), data.get('time', {}).get('s'), geo[0], geo[1], data.get('aqi'), data.get('dominentpol'),
+                             {column: iaqi.get(key, {}).get('v') for column, key in HistoryStore.IAQI_COLUMNS.items()}))
+        elif isinstance(data, list):
+            stations.extend((station.get('uid'), station.get('station', {}).get('time'), station.get('lat'), station.get('lon'), station.get('aqi'), None, {})
+                            for station in data)
+    stations = [station for station in stations if isinstance(station[0], int)]
+
+    records = np.zeros(len(stations), READING_DTYPE)
+    records['station_id'] = [station[0] for station in stations]
+    measured_at = [station[1][:19] if isinstance(station[1], str) else None for station in stations]
+    try:
+        records['measured_at'] = np.array(measured_at, dtype='M8[s]')
+    except ValueError:
+        # Parsing the times one by one when one of them is malformed, so that only that reading is left without a measurement time (NaT)
+        records['measured_at'] = pd.to_datetime(measured_at, errors='coerce', format='ISO8601').to_numpy().astype('M8[s]')
+    for field, position in (('lat', 2), ('lon', 3), ('aqi', 4)):
+        records[field] = np.array([to_number(station[position]) for station in stations], dtype='f4')
+    records['dominant_pollutant'] = [READING_POLLUTANT_CODES.get(station[5], 0) for station in stations]
+    if any(station[6] for station in stations):
+        for column in HistoryStore.IAQI_COLUMNS:
+            records[column] = np.array([to_number(station[6].get(column)) for station in stations], dtype='f4')
     else:
-        # Handling the case where the value is a string (or another non-dictionary type)
-        items.append((parent_key, d))
-# - Finally, it returns a dictionary created from the items list.
-    return dict(items)
+        for column in HistoryStore.IAQI_COLUMNS:
+            records[column] = np.nan
+    return records
+
+# Defining a function which turns reading records into a DataFrame (one row per reading) with the app's column names (see HistoryStore.DISPLAY_NAMES);
+# the 32-bit floats are widened and rounded to 4 decimals (so e.g. 91.1 isn't shown as 91.099998) and columns without any value are left out
+def readings_frame(records):
+    columns = {}
+    for field in READING_DTYPE.names:
+        values = records[field]
+        columns[HistoryStore.DISPLAY_NAMES.get(field, field)] = values.astype('f8').round(4) if values.dtype.kind == 'f' else values
+    columns['Dominent_pollutant'] = pd.Categorical.from_codes(records['dominant_pollutant'].astype('i1') - 1, READING_POLLUTANTS[1:])
+    return pd.DataFrame(columns).dropna(axis=1, how='all')
+
+# Defining a table of the latest reading of every station seen so far, kept as one array of reading records (see get_reading_table() below).
+# - update() keeps, for every station, the reading with the latest measurement time (a reading without one never replaces a reading with one);
+#   the array grows by doubling when it is full.
+# - lookup() returns the readings of the given stations (in the given order, stations without a reading are skipped).
+class ReadingTable:
+    def __init__(self, capacity=1024):
+        self._records = np.zeros(capacity, READING_DTYPE)
+        self._rows = {}  # station id -> row in _records
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def update(self, records):
+        # Keeping only the last reading of every station in the batch
+        _, last = np.unique(records['station_id'][::-1], return_index=True)
+        records = records[::-1][last]
+        with self._lock:
+            rows = np.array([self._rows.get(station_id, -1) for station_id in records['station_id'].tolist()], dtype=np.int64)
+            known = rows >= 0
+            # Replacing a known station's reading unless the stored one is newer (or the new one has no measurement time and the stored one has)
+            replace = known.copy()
+            stored_at = self._records['measured_at'][rows[known]]
+            replace[known] = (records['measured_at'][known] >= stored_at) | np.isnat(stored_at)
+            self._records[rows[replace]] = records[replace]
+
+            new_records = records[~known]
+            start = len(self._rows)
+            if start + len(new_records) > len(self._records):
+                grown = np.zeros(max(2 * len(self._records), start + len(new_records)), READING_DTYPE)
+                grown[:start] = self._records[:start]
+                self._records = grown
+            self._records[start:start + len(new_records)] = new_records
+            self._rows.update(zip(new_records['station_id'].tolist(), range(start, start + len(new_records))))
+
+    def lookup(self, station_ids):
+        with self._lock:
+            rows = [self._rows[station_id] for station_id in station_ids if station_id in self._rows]
+            return self._records[rows]
+
+# Creating the table of the latest readings once per process, so that it is shared by all sessions
+@st.cache_resource
+def get_reading_table():
+    return ReadingTable()
+
+# Defining a function which returns the distances (in km) between the points (lat1, lon1) and (lat2, lon2) along the Earth's surface
+# (haversine formula); the arguments can be single numbers or NumPy arrays
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+# Defining an in-memory index of the stations seen so far, which answers "the nearest station" and "the stations within R km"
+# without asking the WAQI API (see get_station_index() below).
+# - The stations are put into cells of a grid of cell_size x cell_size degrees.
+# - within() only measures the distance (haversine_km()) to the stations in the cells which overlap the circle, so the cost depends on how many stations
+#   are around the point, not on the size of the index. Near the poles or for huge circles the whole width of the grid is searched.
+# - nearest() asks within() for a growing radius (doubled every time) until a station is found.
+# - New stations can be added at any time; only the new or moved ones are passed to on_new (e.g. to be saved in the history store).
+class StationIndex:
+    KM_PER_DEGREE = 111.195
+
+    def __init__(self, cell_size=1.0, on_new=None):
+        self.cell_size = cell_size
+        self.on_new = on_new
+        self._lon_cells = int(round(360 / cell_size))
+        self._cells = {}  # (latitude cell, longitude cell) -> list of station ids
+        self._stations = {}  # station id -> (name, latitude, longitude)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stations)
+
+    # Returning (station id, name) pairs of all the stations
+    def names(self):
+        with self._lock:
+            return [(station_id, station[0]) for station_id, station in self._stations.items() if station[0]]
+
+    # Returning the names of the given stations (None for the stations which aren't in the index)
+    def names_of(self, station_ids):
+        with self._lock:
+            return [self._stations.get(station_id, (None,))[0] for station_id in station_ids]
+
+    # Adding stations given as (station id, name, latitude, longitude) tuples
+    def add(self, stations):
+        new_stations = []
+        with self._lock:
+            for station_id, name, latitude, longitude in stations:
+                old_station = self._stations.get(station_id)
+                if old_station is not None:
+                    if old_station[1:] == (latitude, longitude):
+                        continue
+                    self._cells[self._cell(old_station[1], old_station[2])].remove(station_id)
+                self._stations[station_id] = (name, latitude, longitude)
+                self._cells.setdefault(self._cell(latitude, longitude), []).append(station_id)
+                new_stations.append((station_id, name, latitude, longitude))
+        if new_stations and self.on_new:
+            self.on_new(new_stations)
+        return len(new_stations)
+
+    # Returning the stations within radius_km of the point as (distance in km, station id, name, latitude, longitude) tuples, the nearest first
+    def within(self, latitude, longitude, radius_km):
+        with self._lock:
+            station_ids = [station_id for cell in self._cells_around(latitude, longitude, radius_km) for station_id in self._cells.get(cell, ())]
+            stations = [self._stations[station_id] for station_id in station_ids]
+        if not stations:
+            return []
+        distances = haversine_km(latitude, longitude, np.array([station[1] for station in stations]), np.array([station[2] for station in stations]))
+        found = np.flatnonzero(distances <= radius_km)
+        return [(float(distances[i]), station_ids[i], *stations[i]) for i in found[np.argsort(distances[found])]]
+
+    # Returning the nearest station (like within()) or None if there is no station within max_km
+    def nearest(self, latitude, longitude, max_km=20040):
+        radius_km = self.cell_size * self.KM_PER_DEGREE
+        while True:
+            found = self.within(latitude, longitude, min(radius_km, max_km))
+            if found:
+                return found[0]
+            if radius_km >= max_km:
+                return None
+            radius_km *= 2
+
+    def _cell(self, latitude, longitude):
+        return int(np.floor(latitude / self.cell_size)), int(np.floor((longitude % 360) / self.cell_size)) % self._lon_cells
+
+    # Returning the grid cells which overlap the circle of radius_km around the point
+    def _cells_around(self, latitude, longitude, radius_km):
+        lat_span = radius_km / self.KM_PER_DEGREE
+        south, north = max(latitude - lat_span, -90), min(latitude + lat_span, 90)
+        lat_cells = range(int(np.floor(south / self.cell_size)), int(np.floor(north / self.cell_size)) + 1)
+        widest_lat = max(abs(south), abs(north))
+        lon_span = radius_km / (self.KM_PER_DEGREE * np.cos(np.radians(widest_lat))) if widest_lat < 89.9 else 180
+        if lon_span >= 180:
+            lon_cells = range(self._lon_cells)
+        else:
+            first = int(np.floor((longitude - lon_span) / self.cell_size))
+            lon_cells = sorted({cell % self._lon_cells for cell in range(first, int(np.floor((longitude + lon_span) / self.cell_size)) + 1)})
+        # Looking only at the occupied cells when there are fewer of them than cells around the point
+        if len(lat_cells) * len(lon_cells) > len(self._cells):
+            lon_cells = set(lon_cells)
+            return [cell for cell in self._cells if cell[0] in lat_cells and cell[1] in lon_cells]
+        return [(lat_cell, lon_cell) for lat_cell in lat_cells for lon_cell in lon_cells]
+
+# Creating the station index once per process; it is filled with the stations saved in the history store (if it is turned on),
+# and new stations are saved there as well, so that the index survives restarts
+@st.cache_resource
+def get_station_index():
+    if not WAQI_HISTORY_DB:
+        return StationIndex()
+    history_store = get_history_store()
+    station_index = StationIndex()
+    station_index.add(history_store.load_stations())
+    station_index.on_new = history_store.save_stations
+    return station_index
+
+# Defining a function which adds the station(s) from a WAQI response to the station index:
+# a city feed contains one station ('idx', 'city': {'name', 'geo'}), the map API returns a list of stations ('uid', 'lat', 'lon', 'station': {'name'})
+def index_stations(payload):
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if isinstance(data, dict):
+        geo = data.get('city', {}).get('geo')
+        stations = [(data.get('idx'), data.get('city', {}).get('name'), *(geo or [None, None]))]
+    elif isinstance(data, list):
+        stations = [(station.get('uid'), station.get('station', {}).get('name'), station.get('lat'), station.get('lon')) for station in data]
+    else:
+        return
+    stations = [station for station in stations
+                if isinstance(station[0], int) and all(isinstance(value, (int, float)) for value in station[2:])]
+    try:
+        get_station_index().add([(station_id, name, float(latitude), float(longitude)) for station_id, name, latitude, longitude in stations])
+    except sqlite3.Error as e:
+        print(f"Error: {e} while saving stations")
+    get_city_resolver().add((name, f"@{station_id}") for station_id, name, _, _ in stations if name)
+
+# Defining a function which folds a city name into a simple form, so that e.g. "Łódź", "Lodz" and " lodz " all become "lodz":
+# letters are lower-cased, accents are removed (letters which aren't decomposed by Unicode, like "ł", are replaced by hand)
+# and the whitespace is collapsed
+def fold_city_name(name):
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return " ".join(name.translate(CITY_NAME_LETTERS).split())
+
+CITY_NAME_LETTERS = str.maketrans({'ł': 'l', 'đ': 'd', 'ø': 'o', 'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ı': 'i', 'þ': 'th'})
+
+# Defining a resolver which is put in front of the WAQI API for the custom city names (see get_city_resolver() below):
+# - names are folded (see fold_city_name()), so spelling variants of a known name resolve to the same request (and the same cache entry),
+# - misspelled names are matched to the most similar known name (city from the list, station or custom city which the API already recognized);
+#   the similarity is the share of common three-letter sequences (trigrams), found through a trigram -> names index,
+# - names which the API didn't recognize are remembered for negative_ttl seconds and aren't requested again in the meantime.
+# The custom names (added with custom=True) and the rejected names are limited to max_size each: expired rejected names are dropped,
+# and above max_size the least recently used custom name / the oldest rejected name is forgotten first.
+# stats counts how the names were resolved; "avoided" is the number of requests which weren't sent at all thanks to the resolver:
+# rejected names asked again, and names resolved to another city whose response is cached (is_cached(city) tells that,
+# e.g. a misspelling of a city which was just shown); names which only differ in case, accents or spaces share a cache key anyway.
+class CityResolver:
+    def __init__(self, negative_ttl, threshold, max_size, is_cached=None):
+        self.negative_ttl = negative_ttl
+        self.threshold = threshold
+        self.max_size = max_size
+        self.is_cached = is_cached or (lambda city: False)
+        self.stats = {"known": 0, "fuzzy": 0, "negative": 0, "passed": 0, "rejected": 0, "avoided": 0}
+        self._known = {}  # folded name -> what to request (e.g. the city name or "@<station id>") and the name to show
+        self._custom = OrderedDict()  # folded custom names, the least recently used first
+        self._trigrams = {}  # trigram -> folded names which contain it
+        self._rejected = OrderedDict()  # folded name -> time until which it is considered unknown, the earliest first
+        self._lock = threading.Lock()
+
+    # Adding known names given as (name, what to request) pairs; custom=True marks names entered by the users
+    def add(self, names, custom=False):
+        with self._lock:
+            for name, query in names:
+                folded = fold_city_name(name)
+                if not folded:
+                    continue
+                if folded in self._custom:
+                    self._custom.move_to_end(folded)
+                if folded in self._known:
+                    continue
+                self._known[folded] = (query, name)
+                for trigram in self._trigrams_of(folded):
+                    self._trigrams.setdefault(trigram, set()).add(folded)
+                if custom:
+                    self._custom[folded] = True
+            while len(self._custom) > self.max_size:
+                self._forget(self._custom.popitem(last=False)[0])
+
+    def reject(self, name):
+        with self._lock:
+            self.stats["rejected"] += 1
+            folded = fold_city_name(name)
+            self._rejected.pop(folded, None)
+            self._rejected[folded] = time.monotonic() + self.negative_ttl
+            # Every name is rejected for the same time, so the expired ones are at the start
+            now = time.monotonic()
+            while self._rejected and (len(self._rejected) > self.max_size or next(iter(self._rejected.values())) <= now):
+                self._rejected.popitem(last=False)
+
+    # Returning what to request for the entered name and a note for the user (or None);
+    # (None, note) means that the name is known to be unknown to the API and shouldn't be requested
+    def resolve(self, text):
+        folded = fold_city_name(text)
+        with self._lock:
+            rejected_until = self._rejected.get(folded)
+            if rejected_until is not None:
+                if rejected_until > time.monotonic():
+                    self.stats["negative"] += 1
+                    self.stats["avoided"] += 1
+                    return None, f"No station called \"{text.strip()}\" was found (recently checked)"
+                del self._rejected[folded]
+            match = folded if folded in self._known else self._best_match(folded)
+            if match is None:
+                self.stats["passed"] += 1
+                return text.strip(), None
+            if match in self._custom:
+                self._custom.move_to_end(match)
+            query, name = self._known[match]
+            self.stats["known" if match == folded else "fuzzy"] += 1
+        # Checking the feed cache outside of the lock (it has a lock of its own)
+        if fold_city_name(query) != folded and self.is_cached(query):
+            with self._lock:
+                self.stats["avoided"] += 1
+        return query, None if fold_city_name(name) == folded else f"Showing results for: {name}"
+
+    # Removing a known name and its trigrams (the lock must be held)
+    def _forget(self, folded):
+        del self._known[folded]
+        for trigram in self._trigrams_of(folded):
+            names = self._trigrams[trigram]
+            names.discard(folded)
+            if not names:
+                del self._trigrams[trigram]
+
+    # Returning the known (folded) name most similar to the folded name, if it is similar enough (the lock must be held)
+    def _best_match(self, folded):
+        trigrams = self._trigrams_of(folded)
+        shared = {}
+        for trigram in trigrams:
+            for candidate in self._trigrams.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        best, best_similarity = None, self.threshold
+        for candidate, count in shared.items():
+            similarity = count / (len(trigrams) + len(self._trigrams_of(candidate)) - count)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    @staticmethod
+    def _trigrams_of(folded):
+        padded = f"  {folded} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Creating the resolver once per process, knowing the cities from the list and the stations from the station index;
+# a request counts as avoided when the feed cache has a fresh response for the resolved city
+@st.cache_resource
+def get_city_resolver():
+    city_resolver = CityResolver(WAQI_NEGATIVE_TTL, CITY_MATCH_THRESHOLD, CITY_RESOLVER_SIZE,
+                                 is_cached=lambda city: get_feed_cache().is_fresh(normalize_city_key(city)))
+    city_resolver.add((city, city) for city in CITIES)
+    city_resolver.add((name, f"@{station_id}") for station_id, name in get_station_index().names())
+    return city_resolver
+
+# Defining a function which turns the text entered as a custom city into the city to request:
+# coordinates ("latitude, longitude") are resolved to the nearest known station ("@<station id>") if there is one within max_km,
+# otherwise to WAQI's geo feed ("geo:<latitude>;<longitude>"). Names are resolved by the city resolver (see CityResolver).
+# It also returns a note for the user (or None); if the city is None, the name is known not to exist and shouldn't be requested.
+def resolve_custom_city(text, max_km=50):
+    parts = text.replace(';', ',').split(',')
+    try:
+        latitude, longitude = (float(part) for part in parts)
+    except ValueError:
+        return get_city_resolver().resolve(text)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return get_city_resolver().resolve(text)
+    station = get_station_index().nearest(latitude, longitude, max_km)
+    if station is None:
+        return f"geo:{latitude};{longitude}", None
+    distance, station_id, name, _, _ = station
+    return f"@{station_id}", f"Nearest known station: {name} ({distance:.1f} km away)"
 
 # Defining a function that retrieves air quality information for a specified city using the World Air Quality Index (WAQI) API. 
+# Every call sends one request to the API, so the app should go through get_city_feed() instead of calling it directly.
 def get_air_quality(city):
-    base_url = "https://api.waqi.info/"
-    endpoint = f"/feed/{city}/?token=136f8d87c3aa5d2a7a6fe9b84cb80ac79abf0adf"
-    url = base_url + endpoint
+    endpoint = f"feed/{city}/?token={WAQI_TOKEN}"
+    url = WAQI_BASE_URL + endpoint
 
     try:
-        response = requests.get(url)
+        response = get_waqi_client().get(url)
         data = response.json()
 
-        if response.status_code == 200:
+        # The API answers unknown cities with {"status": "error", "data": "Unknown station"};
+        # other errors (e.g. "Over quota" or "Invalid key") are temporary, so the city isn't remembered as unknown
+        if response.status_code == 200 and data.get('status') == 'error':
+            print(f"Error: {data.get('data')} for city {city}")
+            if data.get('data') == 'Unknown station':
+                get_city_resolver().reject(city)
+            return None
+        elif response.status_code == 200:
+            # Keeping the reading in the history store
+            if WAQI_HISTORY_DB:
+                try:
+                    get_history_store().append([(city, data)])
+                except sqlite3.Error as e:
+                    print(f"Error: {e} while saving the reading for city {city}")
+            # Adding the station to the station index and its reading to the table of the latest readings
+            index_stations(data)
+            get_reading_table().update(build_readings([data]))
             return data
         else:
             print(f"Error: {data['status']}")
@@ -162,164 +1025,339 @@ def get_air_quality(city):
         print(f"Error: {e}")
         return None
 
-# Defining a function which fetches air quality data for a specified location using the get_air_quality function and processes the data into a DataFrame. 
+# Defining a cache for WAQI responses which is shared by all sessions (see get_feed_cache() below).
+# - Fresh responses (younger than ttl) are returned straight from memory.
+# - Stale responses (younger than ttl + stale_ttl) are returned immediately as well, while a background thread fetches a new one (stale-while-revalidate)
+#   with refresh_loader (if given), so that the refresh isn't counted as a request of the render which happened to trigger it.
+# - Older or missing responses are fetched by the caller; other callers asking for the same key at the same time wait for that fetch instead of sending their own
+#   and get its result (so when the fetch fails, all of them get None, not the expired response).
+# - When there are more than max_size entries, the least recently used one is evicted.
+# - Failed requests (None) are never cached.
+class FeedCache:
+    def __init__(self, ttl, stale_ttl, max_size):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "refreshes": 0}
+        self._entries = OrderedDict()  # key -> (time when fetched, payload)
+        self._loading = {}  # key -> [threading.Event set when the fetch of that key is finished, the fetched payload]
+        self._lock = threading.Lock()
+
+    def get(self, key, loader, refresh_loader=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    if age < self.ttl:
+                        self.stats["hits"] += 1
+                    else:
+                        self.stats["stale_hits"] += 1
+                        self._start_loading(key, refresh_loader or loader, background=True)
+                    return entry[1]
+            self.stats["misses"] += 1
+            waiting_for = self._loading.get(key)
+            if waiting_for is None:
+                self._start_loading(key, loader, background=False)
+
+        if waiting_for is not None:
+            event, _ = waiting_for
+            event.wait()
+            return waiting_for[1]
+        return self._load(key, loader)
+
+    # Returning whether a fresh response for the key is cached, i.e. get() would return it without any request
+    def is_fresh(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def put(self, key, payload):
+        if payload is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    # Marking the key as being loaded (the lock must be held); for background refreshes also starting the thread
+    def _start_loading(self, key, loader, background):
+        if key in self._loading:
+            return
+        self._loading[key] = [threading.Event(), None]
+        if background:
+            self.stats["refreshes"] += 1
+            threading.Thread(target=self._load, args=(key, loader), daemon=True).start()
+
+    def _load(self, key, loader):
+        payload = None
+        try:
+            payload = loader()
+            self.put(key, payload)
+            return payload
+        finally:
+            with self._lock:
+                loading = self._loading.pop(key)
+            loading[1] = payload
+            loading[0].set()
+
+# Creating the feed cache once per process, so that it survives reruns and is shared by all sessions
+@st.cache_resource
+def get_feed_cache():
+    return FeedCache(WAQI_CACHE_TTL, WAQI_CACHE_STALE_TTL, WAQI_CACHE_SIZE)
+
+# Defining a background poller which refreshes the feed cache on a schedule, so that page renders only read from memory.
+# - It refreshes the given cities plus the custom cities which were requested recently (see track()).
+# - Every city is refreshed every interval seconds; after a failed request the city is retried with an exponential backoff instead.
+# - status() reports when every city was last refreshed and how old (lag, in seconds) its data is.
+class FeedPoller:
+    MAX_BACKOFF = 3600
+
+    def __init__(self, cache, cities, interval, max_recent):
+        self.cache = cache
+        self.cities = list(cities)
+        self.interval = interval
+        self.max_recent = max_recent
+        self._recent = OrderedDict()  # recently requested custom cities, the least recent first
+        self._status = {}  # city -> {"last_refresh": ..., "next_refresh": ..., "failures": ..., "last_error": ...}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="waqi-poller", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def track(self, city):
+        if city in self.cities:
+            return
+        with self._lock:
+            self._recent[city] = True
+            self._recent.move_to_end(city)
+            while len(self._recent) > self.max_recent:
+                dropped, _ = self._recent.popitem(last=False)
+                self._status.pop(dropped, None)
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            return [{"City": city,
+                     "Last_refresh_(UTC)": pd.to_datetime(status["last_refresh"], unit='s') if status["last_refresh"] else None,
+                     "Lag_(s)": round(now - status["last_refresh"]) if status["last_refresh"] else None,
+                     "Failures": status["failures"],
+                     "Last_error": status["last_error"]}
+                    for city, status in self._status.items()]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                cities = self.cities + list(self._recent)
+            for city in cities:
+                with self._lock:
+                    # Skipping the custom cities which track() has dropped since the list was taken, so that their status isn't added back
+                    if city not in self._recent and city not in self.cities:
+                        continue
+                    status = self._status.setdefault(city, {"last_refresh": None, "next_refresh": 0, "failures": 0, "last_error": None})
+                    due = status["next_refresh"] <= time.time()
+                if due:
+                    self._refresh(city, status)
+            time.sleep(1)
+
+    def _refresh(self, city, status):
+        try:
+            payload = get_air_quality(city)
+            error = None if payload else "no data"
+        except Exception as e:
+            payload, error = None, str(e)
+
+        now = time.time()
+        with self._lock:
+            if error is None:
+                self.cache.put(normalize_city_key(city), payload)
+                status.update(last_refresh=now, next_refresh=now + self.interval, failures=0, last_error=None)
+            else:
+                status["failures"] += 1
+                backoff = min(30 * 2 ** (status["failures"] - 1), self.MAX_BACKOFF)
+                status.update(next_refresh=now + backoff * random.uniform(0.8, 1.2), last_error=error)
+
+# Starting the background poller once per process (only if it is turned on with WAQI_POLLER=1)
+@st.cache_resource
+def get_feed_poller():
+    return FeedPoller(get_feed_cache(), CITIES, WAQI_POLL_INTERVAL, WAQI_POLL_RECENT_SIZE).start()
+
+# Defining a function which turns a city name (or a station, e.g. "@1234") into a cache key, so that e.g. "Łódź" and " lodz" share one entry
+def normalize_city_key(city):
+    return fold_city_name(city)
+
+# Defining a function which returns the WAQI response for a specified city.
+# The /feed/{city}/ response contains both the current conditions and the daily forecast,
+# so it is fetched only once per city per render and then shared by fetch_air_quality_data() and get_air_quality_forecast().
+# Responses are taken from the shared feed cache whenever possible; only cache misses reach the WAQI API
+# (stale responses are refreshed in the background with get_air_quality(), outside of the render's profile).
+def get_city_feed(city):
+    if city not in city_feeds:
+        city_feeds[city] = get_feed_cache().get(normalize_city_key(city), lambda: load_city_feed(city), lambda: get_air_quality(city))
+    return city_feeds[city]
+
+# Defining a function which requests the WAQI response for a specified city on behalf of the current render, counting the request in network_calls
+@timed_stage("network")
+def load_city_feed(city):
+    count_network_call()
+    return get_air_quality(city)
+
+# Defining a function which counts a request sent to the WAQI API on behalf of the current render
+def count_network_call():
+    global network_calls
+    with network_calls_lock:
+        network_calls += 1
+
+# Defining a function which fetches air quality data for a specified location using the get_city_feed function and processes the data into a DataFrame. 
 def fetch_air_quality_data(selected_location, columns_to_exclude=None):
     global df_all  # Using the global keyword to access the df_all in the broader scope
-    data_list = []
-
-    result = get_air_quality(selected_location)
-
-    if result:
-        flat_data = flatten_dict(result['data'], exclude_keys=['city_location', 'forecast_daily_uvi', 'city_name', 'attributions', 'city_url', 'time_v',
-                                                                'debug_sync', 'time_tz', 'time_iso', 'forecast_daily_o3', 'forecast_daily_pm10', 'forecast_daily_pm25'])
-        city_data = {
-            "city": selected_location,
-            **flat_data
-        }
-        data_list.append(city_data)
-
-    df_all = pd.DataFrame(data_list)
-    df_all['city'] = df_all['city'].astype(str)
-    df_all.set_index('city', inplace=True)
-    # Renaming column names for better readability
-    df_all.rename(columns={'iaqi_co_v': 'Carbon_Monoxyde',
-                           'iaqi_h_v': 'Relative_Humidity',
-                           'iaqi_no2_v': 'Nitrogen_Dioxide',
-                           'iaqi_o3_v': 'Ozone',
-                           'iaqi_p_v': 'Atmospheric_Pressure',
-                           'iaqi_pm10_v': 'Particulate_Matter_(10µm)',
-                           'iaqi_pm25_v': 'Particulate_Matter_(2.5µm)',
-                           'iaqi_so2_v': 'Sulphur_Dioxide',
-                           'iaqi_t_v': 'Temperature',
-                           'iaqi_w_v': 'Wind',
-                           'iaqi_dew_v': 'Dew',
-                           'iaqi_r_v': 'Rain_(precipitation)',
-                           'city_geo': 'Station_lat/long',
-                           'time_s': 'Local_measurement_time',
-                           'dominentpol': 'Dominent_pollutant',
-                           'idx': 'Station_id',
-                           'aqi': 'AQI',
-
-                        
-                        
-                           }, inplace=True)
-
-    # Checking if columns to exclude are present in the DataFrame
-    if columns_to_exclude:
-        columns_to_exclude = [col for col in columns_to_exclude if col in df_all.columns]
-        df_all = df_all.drop(columns=columns_to_exclude)
-
-    # Returning the resulting DataFrame
+    df_all = build_air_quality_frame(selected_location, get_city_feed(selected_location), columns_to_exclude)
     return df_all
 
+# Defining a function which processes a WAQI response for a specified location into a DataFrame (one row, indexed by the location).
+def build_air_quality_frame(selected_location, result, columns_to_exclude=None):
+    flattener = FeedFlattener(AIR_QUALITY_SCHEMA, columns_to_exclude or ())
+    return flattener([selected_location], [result])
+
+# Defining a function which fetches air quality data for many locations in parallel and combines them into one DataFrame
+# (with the same columns as fetch_air_quality_data(), one row per location).
+# - At most max_workers locations are fetched at the same time.
+# - Locations which fail or don't answer within timeout seconds are skipped, so one slow city doesn't hold up the others.
+def fetch_all_cities_data(cities, max_workers=None, timeout=None, columns_to_exclude=None):
+    max_workers = max_workers or WAQI_MAX_CONNECTIONS
+    timeout = timeout or WAQI_BATCH_TIMEOUT
+    # Creating the shared cache and HTTP client here, in the script thread, before the worker threads need them
+    get_feed_cache()
+    get_waqi_client()
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(get_city_feed, city): city for city in cities}
+    done, not_done = wait(futures, timeout=timeout)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    city_results = {}
+    for future in done:
+        try:
+            city_results[futures[future]] = future.result()
+        except Exception as e:
+            print(f"Error: {e} for city {futures[future]}")
+    for future in not_done:
+        print(f"Error: no response within {timeout} s for city {futures[future]}")
+
+    # Building the DataFrame of all the cities in one go, keeping the order of the cities list
+    answered = [city for city in cities if city in city_results]
+    flattener = FeedFlattener(AIR_QUALITY_SCHEMA, columns_to_exclude or ())
+    return flattener(answered, [city_results[city] for city in answered])
+
 ####################################################################################################
+# Defining the AQI bands used to classify the air quality, from the cleanest to the most polluted air.
+# Every band is described by: the highest AQI value which still belongs to it, its category, its colour (for a more user-friendly, visual interface)
+# and a descriptive message regarding the air quality and potential health implications.
+AQI_BANDS = [
+    (50, "Good", "lightgreen", "Air quality is good. The air pollution pose no threat. The conditions ideal for outdoor activities."),
+    (100, "Moderate", "yellow", "Air quality is moderate. The air pollution pose minimal risk to exposed persons. People with respiratory diseases should limit outdoor exertion."),
+    (150, "Unhealthy for sensitive groups", "orange", "Air quality may be unhealthy for certains groups. People with respiratory diseases should limit outdoor exertion."),
+    (200, "Unhealthy", "red", "Air quality is unhealty. The air pollution pose a threat for people at risk which may experience health effects. Other people should limit spending time outdoors, especially when they experience symptoms such as cough or sore throat."),
+    (300, "Very unhealthy", "lavender", "Air quality is bad. People at risk should avoid going outside. The rest should limit outdoor activities."),
+    (np.inf, "Hazardous", "burlywood", "The quality of air is dangerously wrong. Those at risk should avoid going outside. Others should limit the output to a minimum. All outdoor activities are discouraged."),
+]
+AQI_BAND_LIMITS = np.array([band[0] for band in AQI_BANDS])
+# Defining the RGB values of the band colours (and of "gray", used for stations without data) for maps which don't accept colour names
+AQI_COLOR_RGB = {"lightgreen": [144, 238, 144], "yellow": [255, 255, 0], "orange": [255, 165, 0], "red": [255, 0, 0],
+                 "lavender": [230, 230, 250], "burlywood": [222, 184, 135], "gray": [128, 128, 128]}
+
+# Defining a function which classifies many AQI values at once (a list, a NumPy array or a pandas Series).
+# Every value is looked up in AQI_BAND_LIMITS with a binary search (np.searchsorted), e.g. 50 -> "Good", 50.5 and 51 -> "Moderate".
+# It returns a DataFrame with the Category, Color and Message of every value (as categoricals, so every distinct text is stored only once).
+# Values which aren't a number (e.g. "-" returned by the API for stations without data) or are negative get no category (NaN).
+def classify_air_quality(aqi_values):
+    index = aqi_values.index if isinstance(aqi_values, pd.Series) else None
+    values = pd.to_numeric(pd.Series(aqi_values, index=index), errors='coerce').to_numpy(dtype=float)
+    codes = np.searchsorted(AQI_BAND_LIMITS, values, side='left')
+    codes[np.isnan(values) | (values < 0)] = -1
+
+    return pd.DataFrame({
+        'Category': pd.Categorical.from_codes(codes, categories=[band[1] for band in AQI_BANDS]),
+        'Color': pd.Categorical.from_codes(codes, categories=[band[2] for band in AQI_BANDS]),
+        'Message': pd.Categorical.from_codes(codes, categories=[band[3] for band in AQI_BANDS]),
+    }, index=index)
+
+# Defining a function which returns the AQI band (see AQI_BANDS) of a single AQI value, or None if the value isn't a non-negative number
+def get_air_quality_band(aqi_value):
+    aqi_value = pd.to_numeric(aqi_value, errors='coerce')
+    if pd.isna(aqi_value) or aqi_value < 0:
+        return None
+    return AQI_BANDS[int(np.searchsorted(AQI_BAND_LIMITS, aqi_value, side='left'))]
+
 # Defining a function which generates a descriptive message based on the Air Quality Index (AQI) value
-# It uses a series of if and elif statements to categorize the air quality level based on the specified ranges.
-# Each range corresponds to a different descriptive message regarding the air quality and potential health implications.
 def get_air_quality_message(aqi_value):
-    if 0 <= aqi_value <= 50:
-        return "Air quality is good. The air pollution pose no threat. The conditions ideal for outdoor activities."
-    elif 51 <= aqi_value <= 100:
-        return "Air quality is moderate. The air pollution pose minimal risk to exposed persons. People with respiratory diseases should limit outdoor exertion."
-    elif 101 <= aqi_value <= 150:
-        return "Air quality may be unhealthy for certains groups. People with respiratory diseases should limit outdoor exertion."
-    elif 151 <= aqi_value <= 200:
-        return "Air quality is unhealty. The air pollution pose a threat for people at risk which may experience health effects. Other people should limit spending time outdoors, especially when they experience symptoms such as cough or sore throat."
-    elif 201 <= aqi_value <= 300:
-        return "Air quality is bad. People at risk should avoid going outside. The rest should limit outdoor activities."
-    elif aqi_value > 300:
-        return "The quality of air is dangerously wrong. Those at risk should avoid going outside. Others should limit the output to a minimum. All outdoor activities are discouraged."
+    band = get_air_quality_band(aqi_value)
+    return band[3] if band else None
 
 # Defining a function which assigns a color based on the Air Quality Index (AQI) value (for a more user-friendly, visual interface )  
 def get_air_quality_color(aqi_value):
-    if 0 <= aqi_value <= 50:
-        return "lightgreen"
-    elif 51 <= aqi_value <= 100:
-        return "yellow"
-    elif 101 <= aqi_value <= 150:
-        return "orange"
-    elif 151 <= aqi_value <= 200:
-        return "red"
-    elif 201 <= aqi_value <= 300:
-        return "lavender"
-    elif aqi_value > 300:
-        return "burlywood"
+    band = get_air_quality_band(aqi_value)
+    return band[2] if band else None
  
-# Defining a function that fetches air quality forecast data (specifically daily forecast data for O3, PM10, and PM2.5) 
-# for a specified city using the World Air Quality Index (WAQI) API   
+# Defining a function that extracts the daily air quality forecast for a specified city
+# from the same WAQI response that fetch_air_quality_data() uses (see get_city_feed())
 def get_air_quality_forecast(city):
-    base_url = "https://api.waqi.info/"
-    endpoint = f"/feed/{city}/?token=136f8d87c3aa5d2a7a6fe9b84cb80ac79abf0adf"
-    url = base_url + endpoint
-
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        response_data = response.json()
-        extracted_data = response_data.get('data', {})
-        forecast_data = extracted_data.get('forecast', {})
-        daily_forecast_data = forecast_data.get('daily', {})
-
-        # Checking if 'daily_forecast_data' is a dictionary
-        if isinstance(daily_forecast_data, dict):
-            # Extracting relevant data for the DataFrames
-            o3_daily_forecast_data = daily_forecast_data.get('o3', [{}])
-            pm10_daily_forecast_data = daily_forecast_data.get('pm10', [{}])
-            pm25_daily_forecast_data = daily_forecast_data.get('pm25', [{}])
-
-            # Creating a DataFrame for daily forecast of O3:
-            o3_daily_forecast_df = pd.DataFrame(o3_daily_forecast_data)
-            o3_daily_forecast_df['city'] = city
-            o3_daily_forecast_df.set_index('city', inplace=True)
-
-            # Creating a DataFrame for daily forecast of PM10:
-            pm10_daily_forecast_df = pd.DataFrame(pm10_daily_forecast_data)
-            pm10_daily_forecast_df['city'] = city
-            pm10_daily_forecast_df.set_index('city', inplace=True)
-
-            # Creating a DataFrame for daily forecast of PM25:
-            pm25_daily_forecast_df = pd.DataFrame(pm25_daily_forecast_data)
-            pm25_daily_forecast_df['city'] = city
-            pm25_daily_forecast_df.set_index('city', inplace=True)
-
-            return o3_daily_forecast_df, pm10_daily_forecast_df, pm25_daily_forecast_df
-        else:
-            print(f"Warning: 'daily_forecast_data' has unexpected structure for city {city}")
-    else:
-        print(f"Error: {response.status_code} for city {city}")
-        print(response.text)
+    response_data = get_city_feed(city)
+    if not response_data:
+        print(f"Error: no air quality data for city {city}")
+    return build_forecast_frame(response_data)
 
-# Defining a function which will return a DataFrame with column names prefixed by the specified prefix
-# The function is used later on in add_prefixes() function
-def add_prefixes(df, prefix):
-    return df.rename(columns=lambda col: f"{prefix}_{col}")
+# Defining a function which turns the daily forecast of a WAQI response into one tidy DataFrame: a row per day and pollutant,
+# with the columns day, pollutant, avg, min and max. It is built in a single pass over the response:
+# - every pollutant in the response is included (o3, pm10, pm25, uvi, ...), without listing them anywhere,
+# - every row keeps its own date, so pollutants forecast for different days are never mixed up,
+# - a day which is repeated in the forecast of a pollutant keeps its last values.
+def build_forecast_frame(response_data):
+    data = response_data.get('data') if isinstance(response_data, dict) else None
+    daily_forecast_data = data.get('forecast', {}).get('daily', {}) if isinstance(data, dict) else {}
+    forecasts_by_day = {}  # (pollutant, day) -> (avg, min, max)
+    for pollutant, forecasts in daily_forecast_data.items():
+        if not isinstance(forecasts, list):
+            print(f"Warning: forecast of {pollutant} has unexpected structure")
+            continue
+        for forecast in forecasts:
+            forecasts_by_day[(pollutant, forecast.get('day'))] = (forecast.get('avg'), forecast.get('min'), forecast.get('max'))
 
+    # Missing values (None) become NaN
+    values = np.array(list(forecasts_by_day.values()), dtype=float).reshape(-1, 3)
+    return pd.DataFrame({
+        'day': pd.Series([date.fromisoformat(day) if day else None for _, day in forecasts_by_day], dtype=object),
+        'pollutant': pd.Categorical([pollutant for pollutant, _ in forecasts_by_day]),
+        'avg': values[:, 0],
+        'min': values[:, 1],
+        'max': values[:, 2],
+    })
+
+@timed_stage("forecast")
 def fetch_air_quality_forecast(selected_location):
     # Fetching air quality forecast data only for the selected city
-    o3_df, pm10_df, pm25_df = get_air_quality_forecast(selected_location)
-
-    # Adding prefixes to columns for each pollutant
-    o3_df = add_prefixes(o3_df, 'o3')
-    pm10_df = add_prefixes(pm10_df, 'pm10')
-    pm25_df = add_prefixes(pm25_df, 'pm25')
-
-    # Adding the city name as a column in each DataFrame
-    o3_df['o3_city'] = selected_location
-    pm10_df['pm10_city'] = selected_location
-    pm25_df['pm25_city'] = selected_location
-
-    # Concatenating the DataFrames along the columns
-    combined_df = pd.concat([o3_df, pm10_df, pm25_df], axis=1)
-
-    return combined_df
-
+    return get_air_quality_forecast(selected_location)
 
+# Defining a function which turns the tidy forecast into a table with a row per date and the avg, max and min columns of every pollutant
+# (e.g. o3_avg, o3_max, o3_min, pm10_avg, ...); days for which a pollutant has no forecast are left empty
+def pivot_forecast_frame(df_forecast):
+    df_table = df_forecast.pivot(index='day', columns='pollutant', values=['avg', 'max', 'min'])
+    df_table.columns = [f"{pollutant}_{stat}" for stat, pollutant in df_table.columns]
+    columns = [f"{pollutant}_{stat}" for pollutant in df_forecast['pollutant'].cat.categories for stat in ['avg', 'max', 'min']]
+    return df_table.reindex(columns=columns).rename_axis('Date')
 
 ###########################################################################################
 # Creating a line plot for air quality forecast data. 
-# The resulting plot includes three lines representing the average values for O3, PM10, and PM2.5 pollutants
+# The resulting plot includes a line representing the average values for every pollutant in the (tidy) forecast
+@timed_stage("forecast_chart")
 def plot_air_quality_forecast(df_air_quality_forecast):
-    fig = px.line(df_air_quality_forecast, x=df_air_quality_forecast.index, y=["o3_avg", "pm10_avg", "pm25_avg"], title="Air Pollutants Forecast")
+    import plotly.express as px
+    fig = px.line(df_air_quality_forecast, x='day', y='avg', color='pollutant', title="Air Pollutants Forecast")
     st.plotly_chart(fig, use_container_width=True)
 
 # Defining a function to display air quality data and forecasts for a selected city
@@ -327,32 +1365,87 @@ def display_air_quality_data(city_select, df_air_quality):
     # Fetching air quality forecast data
     df_air_quality_forecast = fetch_air_quality_forecast(city_select)
 
+    # Remembering the station id for the history chart before the column is excluded
+    station_id = df_air_quality.at[city_select, 'Station_id'] if 'Station_id' in df_air_quality.columns else None
+
     # Excluding specified columns from df_air_quality
     columns_to_exclude = ["Station_id", "iaqi_wa_v", "iaqi_wg_v",]
     df_air_quality = df_air_quality.drop(columns=columns_to_exclude, errors='ignore')
-    # Excluding specified columns from df_air_quality_forecast
-    columns_to_exclude2 = ["o3_city", "pm10_city", "pm25_city", "pm10_day", "pm25_day",]
-    df_air_quality_forecast = df_air_quality_forecast.drop(columns=columns_to_exclude2, errors='ignore')
-    # Renaming and formatting columns in df_air_quality_forecast
-    df_air_quality_forecast = df_air_quality_forecast.rename(columns={'o3_day': 'Date'})
-    df_air_quality_forecast['Date'] = pd.to_datetime(df_air_quality_forecast['Date']).dt.date
-    df_air_quality_forecast.set_index('Date', inplace=True)
 
     st.divider()
     # Displaying DataFrames in Streamlit app
     st.dataframe(df_air_quality)
-    st.dataframe(df_air_quality_forecast)
+    st.dataframe(pivot_forecast_frame(df_air_quality_forecast))
 
     # Checking if 'Station_lat/long' column is present in df_air_quality
     if 'Station_lat/long' in df_air_quality.columns:
         location_data = df_air_quality.at[city_select, 'Station_lat/long']
         # Displaying a folium map (see the display_folium_map() below)
         display_folium_map(city_select, location_data, df_air_quality)
+        # Listing the other known stations around (see StationIndex)
+        display_nearby_stations(location_data, station_id)
 
         # Plotting air quality forecast
-        plot_air_quality_forecast(df_air_quality_forecast)
+        if not df_air_quality_forecast.empty:
+            plot_air_quality_forecast(df_air_quality_forecast)
+
+    # Plotting the readings of the station stored over the last week (see HistoryStore)
+    if WAQI_HISTORY_DB and station_id is not None:
+        plot_air_quality_history(station_id)
+
+# Defining a function to display the other known stations within radius_km of the given location (see StationIndex),
+# with their latest known AQI (see ReadingTable)
+def display_nearby_stations(location_data, station_id, radius_km=25):
+    if not isinstance(location_data, list):
+        return
+    nearby = [station for station in get_station_index().within(*location_data, radius_km) if station[1] != station_id]
+    if nearby:
+        records = get_reading_table().lookup([station[1] for station in nearby])
+        df_readings = readings_frame(records).reindex(columns=['Station_id', 'AQI', 'Local_measurement_time']).set_index('Station_id')
+        df_nearby = pd.DataFrame([(nearby_id, name, round(distance, 1)) for distance, nearby_id, name, _, _ in nearby],
+                                 columns=['Station_id', 'Station', 'Distance_(km)'])
+        with st.expander(f'Other stations within {radius_km} km'):
+            st.dataframe(df_nearby.join(df_readings, on='Station_id').drop(columns='Station_id'))
+
+# Creating a line chart of the AQI readings of a station stored in the history store during the last 7 days
+@timed_stage("history_chart")
+def plot_air_quality_history(station_id, days=7):
+    df_history = get_history_store().query(station_id, days)
+    if len(df_history) > 1:
+        st.subheader(f'AQI over the last {days} days')
+        st.line_chart(df_history, x='Local_measurement_time', y='AQI')
+
+# Defining a function which renders a Folium map into HTML. The map is:
+# - centered at `center` with the `zoom` zoom level, or zoomed so that all the markers are visible (if center is None),
+# - given one marker for every (latitude, longitude, popup content, colour) tuple in `markers`
+#   (a standard pin if the colour is None, otherwise a circle filled with that colour).
+# The result is cached by all the arguments, so the map is only rebuilt when the station data (or the location/zoom) changes.
+# Folium gives every map new random element ids, so before, every rerun produced different HTML and the browser reloaded the whole map.
+# Reusing the same HTML keeps the map's iframe untouched between reruns, and bigger maps (10 kB and more, e.g. with many stations)
+# are also taken from Streamlit's message cache instead of being sent again.
+@st.cache_data(max_entries=256)
+def render_map_html(center, zoom, markers):
+    import folium
+    m = folium.Map(location=list(center) if center else None, zoom_start=zoom)
+    for latitude, longitude, popup_content, color in markers:
+        if color is None:
+            folium.Marker([latitude, longitude], popup=popup_content).add_to(m)
+        else:
+            folium.CircleMarker([latitude, longitude], radius=10, popup=popup_content,
+                                color=color, fill=True, fill_color=color, fill_opacity=0.8).add_to(m)
+    if center is None and markers:
+        m.fit_bounds([[latitude, longitude] for latitude, longitude, _, _ in markers])
+    return folium.Figure().add_child(m).render()
+
+# Defining a function which displays a map rendered by render_map_html() in the Streamlit app (like streamlit_folium's folium_static did)
+# and records the size of its HTML in the render profile
+def display_map_html(html, width=700, height=500):
+    import streamlit.components.v1 as components
+    render_metrics["map_html_bytes"] = render_metrics.get("map_html_bytes", 0) + len(html.encode())
+    components.html(html, width=width, height=height + 10)
 
 # Creating a function to display a Folium map with a marker at the specified location for the selected city
+@timed_stage("map")
 def display_folium_map(city_select, location_data, df_air_quality):
     # The function checks the format of location_data (either a list of coordinates or a string with comma-separated latitude and longitude).
     if isinstance(location_data, list):
@@ -361,6 +1454,7 @@ def display_folium_map(city_select, location_data, df_air_quality):
         latitude, longitude = map(float, location_data.split(','))
     else:
         st.error("Invalid data format for location coordinates.")
+        return
 # It extracts air quality parameters from the df_air_quality DataFrame for the selected city.
     aqi = df_air_quality.at[city_select, 'AQI']
     temperature = df_air_quality.at[city_select, 'Temperature']
@@ -368,35 +1462,204 @@ def display_folium_map(city_select, location_data, df_air_quality):
     wind = df_air_quality.at[city_select, 'Wind']
     relative_humidity = df_air_quality.at[city_select, 'Relative_Humidity']
     dominant_pollutant = df_air_quality.at[city_select, 'Dominent_pollutant']
-# It creates a Folium map (m) centered at the specified location.
-    m = folium.Map(location=[latitude, longitude], zoom_start=7)
 
 # It generates a popup content for the marker, including information about AQI, temperature, atmospheric pressure, wind, humidity, and the dominant pollutant.
     popup_content = f"<b>{city_select}</b><br>AQI: {aqi}<br>Temperature: {temperature}<br>Pressure: {atmospheric_pressure}<br>Wind: {wind}<br>Humidity: {relative_humidity}<br>Dominant Pollutant: {dominant_pollutant}"
-# It adds a marker to the map with the popup content.
-    folium.Marker([latitude, longitude], popup=popup_content).add_to(m)
-# Displaying the Folium map in the Streamlit app.
-    folium_static(m)
+# It creates a map centered at the specified location, with a marker with the popup content, and displays it in the Streamlit app.
+    display_map_html(render_map_html((latitude, longitude), 7, ((latitude, longitude, popup_content, None),)))
+
+# Creating a function to display one Folium map with a circle marker (coloured by its AQI) for every station in df_stations
+@timed_stage("map")
+def display_stations_folium_map(df_stations):
+    markers = []
+    colors = classify_air_quality(df_stations['AQI'])['Color'].astype(object).fillna("gray")
+    for (city, station), color in zip(df_stations.iterrows(), colors):
+        location_data = station.get('Station_lat/long')
+        if not isinstance(location_data, list):
+            continue
+        latitude, longitude = location_data
+        popup_content = f"<b>{city}</b><br>AQI: {station['AQI']}<br>Dominant Pollutant: {station.get('Dominent_pollutant')}"
+        markers.append((latitude, longitude, popup_content, color))
+    # Zooming the map so that every station is visible
+    display_map_html(render_map_html(None, 6, tuple(markers)))
+
+# Defining a function to display the "All cities" overview: a table of all cities ranked by AQI (the cleanest air first) and a map of all stations
+def display_all_cities_overview(cities):
+    df_all_cities = fetch_all_cities_data(cities)
+    if df_all_cities.empty:
+        st.warning("No data available for the selected cities")
+        return
+
+    # The API returns "-" instead of a number when a station has no current AQI
+    df_all_cities['AQI'] = pd.to_numeric(df_all_cities['AQI'], errors='coerce')
+    df_all_cities = df_all_cities.sort_values('AQI')
+    df_all_cities.insert(0, 'Rank', range(1, len(df_all_cities) + 1))
+    df_all_cities.insert(2, 'Category', classify_air_quality(df_all_cities['AQI'])['Category'])
+
+    st.divider()
+    st.dataframe(df_all_cities.drop(columns=["Station_id", "iaqi_wa_v", "iaqi_wg_v"], errors='ignore'))
+    display_stations_folium_map(df_all_cities)
+
+# Defining a function that retrieves all the stations (with their current AQI) within the given bounds (south, west, north, east)
+# using the map API of the World Air Quality Index (WAQI)
+def get_stations_in_bounds(bounds):
+    endpoint = f"map/bounds/?latlng={','.join(str(value) for value in bounds)}&token={WAQI_TOKEN}"
+    url = WAQI_BASE_URL + endpoint
+
+    try:
+        response = get_waqi_client().get(url)
+        data = response.json()
+
+        if response.status_code == 200 and data.get('status') == 'ok':
+            index_stations(data)
+            return data
+        else:
+            print(f"Error: {data['status']}")
+            return None
+    except requests.exceptions.RequestException as e:
+        print(f"Error: {e}")
+        return None
+
+# Defining a function which requests the stations within the given bounds on behalf of the current render, counting the request in network_calls
+# (see read_stations() below)
+@timed_stage("network")
+def load_stations(bounds):
+    count_network_call()
+    return read_stations(bounds)
+
+# Defining a function which requests the stations within the given bounds and returns them as reading records (see build_readings()),
+# which are also added to the table of the latest readings
+def read_stations(bounds):
+    result = get_stations_in_bounds(bounds)
+    if result is None:
+        return None
+    records = build_readings([result])
+    get_reading_table().update(records)
+    return records
+
+# Defining a function which returns a DataFrame of all the stations within the given bounds (one row per station).
+# The stations are kept in the shared feed cache as reading records, like the city feeds; their names are taken from the station index.
+def fetch_stations_data(bounds):
+    records = get_feed_cache().get("bounds:" + ",".join(str(value) for value in bounds), lambda: load_stations(bounds), lambda: read_stations(bounds))
+    if records is None:
+        records = np.zeros(0, READING_DTYPE)
+    return pd.DataFrame({
+        'Station_id': records['station_id'],
+        'Station_name': get_station_index().names_of(records['station_id'].tolist()),
+        'lat': records['lat'],
+        'lon': records['lon'],
+        'AQI': records['aqi'],
+    })
+
+# Defining a function which returns the area (south, west, north, east) visible on a map of the given size (in pixels)
+# centered at `center` with the given zoom level (at zoom 0 the whole world is 256 pixels wide)
+def get_viewport(center, zoom, width=700, height=500):
+    latitude, longitude = center
+    lon_span = 360 * width / 256 / 2 ** zoom
+    lat_span = lon_span * height / width * np.cos(np.radians(latitude))
+    return (latitude - lat_span / 2, longitude - lon_span / 2, latitude + lat_span / 2, longitude + lon_span / 2)
+
+# Defining a function which prepares the stations for a map showing the given viewport (south, west, north, east):
+# - stations outside the viewport are left out,
+# - if more than max_points stations remain, they are merged on a square grid: every grid cell becomes one point placed at the mean position
+#   of its stations, showing their number and the worst (highest) AQI among them. The cell size is the smallest one (found by bisection,
+#   starting from the size which covers the bounding box of the visible stations with max_points cells) for which the number of points fits,
+#   so that the map shows as many points as it can.
+# The result has the columns: Station_name, lat, lon, AQI and Stations (the number of stations behind the point).
+def aggregate_stations(df_stations, viewport, max_points):
+    south, west, north, east = viewport
+    df_visible = df_stations[df_stations['lat'].between(south, north) & df_stations['lon'].between(west, east)]
+    if len(df_visible) <= max_points:
+        return df_visible[['Station_name', 'lat', 'lon', 'AQI']].assign(Stations=1)
+
+    lat, lon = df_visible['lat'].to_numpy(), df_visible['lon'].to_numpy()
+
+    # Returning the grid cells (row and column) of the visible stations for the given cell size and the number of occupied cells
+    def grid_cells(cell_size):
+        lat_cells, lon_cells = np.floor(lat / cell_size), np.floor(lon / cell_size)
+        columns = lon_cells.max() - lon_cells.min() + 1
+        return lat_cells, lon_cells, len(np.unique((lat_cells - lat_cells.min()) * columns + lon_cells - lon_cells.min()))
+
+    # The points fit with cells of size `fits` and (unless the stations are only at a few positions) don't fit with cells of size `too_small`;
+    # the cell size is grown until the points fit and then bisected (on a log scale) between the two
+    cell_size = max(np.ptp(lat), np.ptp(lon), 1e-9) / np.sqrt(max_points)
+    too_small, fits = cell_size / 32, cell_size
+    while grid_cells(fits)[2] > max_points:
+        too_small, fits = fits, fits * 2
+    for _ in range(12):
+        cell_size = np.sqrt(too_small * fits)
+        if grid_cells(cell_size)[2] <= max_points:
+            fits = cell_size
+        else:
+            too_small = cell_size
+
+    lat_cells, lon_cells, _ = grid_cells(fits)
+    df_points = df_visible.groupby([lat_cells, lon_cells]).agg(Station_name=('Station_name', 'first'), lat=('lat', 'mean'), lon=('lon', 'mean'),
+                         AQI=('AQI', 'max'), Stations=('lat', 'size')).reset_index(drop=True)
+    clustered = df_points['Stations'] > 1
+    df_points.loc[clustered, 'Station_name'] = df_points.loc[clustered, 'Stations'].astype(str) + " stations"
+    return df_points
+
+# Creating a function to display a pydeck map of the stations in the viewport defined by center and zoom,
+# with one circle (coloured by its AQI) per station or per cluster of stations (see aggregate_stations())
+@timed_stage("map")
+def display_stations_deck_map(df_stations, center, zoom):
+    import pydeck as pdk
+    df_points = aggregate_stations(df_stations, get_viewport(center, zoom), STATIONS_MAX_POINTS)
+    colors = classify_air_quality(df_points['AQI'])['Color'].astype(object).fillna("gray")
+    df_points = df_points.assign(
+        color=[AQI_COLOR_RGB[color] for color in colors],
+        radius=6 + 3 * np.log2(df_points['Stations']),
+        AQI=df_points['AQI'].round().astype('Int64').astype(str).replace('<NA>', '-'),
+    )
+    render_metrics["map_points"] = len(df_points)
+
+    layer = pdk.Layer("ScatterplotLayer", data=df_points, get_position='[lon, lat]', get_fill_color='color',
+                      get_radius='radius', radius_units='pixels', pickable=True)
+    view_state = pdk.ViewState(latitude=center[0], longitude=center[1], zoom=zoom)
+    st.pydeck_chart(pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip={"text": "{Station_name}\nAQI: {AQI}"}))
+    st.caption(f"{len(df_points)} points showing {df_points['Stations'].sum()} of {len(df_stations)} stations")
 
 # Setting up the Search page pt. 2
-# City search
-if selected == "City search":
+# City search (a fragment: choosing a city or typing a custom one reruns only this page)
+@page_fragment
+def city_search_page():
     # Writing down what text needs to be displayed in the header
     st.subheader('Select location for which You would like to see the Air Quality data')
     # Defining a list of city options (for the selectbox)
-    city_options = ['Custom', "Szczecin", "Bydgoszcz", "Torun", "Lublin", "Gorzow Wielkopolski", "Zielona Gora", "Lodz", "Krakow", "Wroclaw", "Opole", "Rzeszow", "Bialystok", "Gdansk", "Katowice", "Kielce", "Poznan", "Warszawa"]
+    city_options = ['Custom', 'All cities'] + CITIES
     # Creating a selectbox (dropdown) to choose a city
     city_select = st.selectbox(label='Select City', options=city_options, index=len(city_options) - 1, label_visibility='collapsed')
 
+    # Starting the background poller (see FeedPoller) and showing how fresh its data is
+    feed_poller = get_feed_poller() if WAQI_POLLER else None
+    if feed_poller:
+        with st.expander('Data freshness'):
+            st.dataframe(pd.DataFrame(feed_poller.status()))
+
+    # Setting up the overview of all the cities from the list
+    if city_select == 'All cities':
+        display_all_cities_overview(CITIES)
     # Setting up an alternative option -> the custom city input
-    if city_select == 'Custom':
-        city_select = st.text_input('Enter Custom City:')
-        if city_select:
+    elif city_select == 'Custom':
+        city_text = st.text_input('Enter Custom City (or coordinates: latitude, longitude):')
+        # Resolving the name (or coordinates) to the city to request (see resolve_custom_city())
+        city_select, city_note = resolve_custom_city(city_text) if city_text else (None, None)
+        if city_note:
+            st.caption(city_note)
+        if city_text and city_select is None:
+            st.warning(f"No data available for the custom city: {city_text}")
+        elif city_select:
             # Fetching air quality data for the custom city
             df_air_quality_custom = fetch_air_quality_data(city_select)
             if not df_air_quality_custom.empty:
                 # Getting AQI value and displaying information
                 if 'AQI' in df_air_quality_custom.columns:
+                    # Remembering the name, so that its variants and misspellings resolve to it
+                    get_city_resolver().add([(city_text, city_select)], custom=True)
+                    # Asking the background poller to keep the custom city fresh as well
+                    if feed_poller:
+                        feed_poller.track(city_select)
                     aqi_value = df_air_quality_custom.at[city_select, 'AQI']
                     message = get_air_quality_message(aqi_value)
                     color = get_air_quality_color(aqi_value)
@@ -419,14 +1682,39 @@ if selected == "City search":
             display_air_quality_data(city_select, df_air_quality_selected)
         else:
             st.warning(f"No data available for the selected city: {city_select}")
-            aqi_value = df_air_quality_selected.at[city_select, 'AQI']
-            message = get_air_quality_message(aqi_value)
-            color = get_air_quality_color(aqi_value)
-            st.info(message)
-            st.markdown(f'<style>div.st-cc{{background-color: {color};}}</style>', unsafe_allow_html=True)
-            display_air_quality_data(city_select, df_air_quality_selected)
+
+    # Reporting how many requests were sent to the WAQI API while rendering the page (one per city is expected), only when profiling
+    render_metrics["cities"] = len(city_feeds)
+    if AQI_PROFILE:
+        print(f"City search render ({render_scope} rerun): {network_calls} WAQI network call(s) for {len(city_feeds)} city(-ies), feed cache: {get_feed_cache().stats}, city resolver: {get_city_resolver().stats}")
+    report_render_profile("City search")
+
+if selected == "City search":
+    city_search_page()
 
         
+# Setting up the Stations page (a fragment: moving the sliders reruns only this page)
+@page_fragment
+def stations_page():
+    st.subheader('Air quality at all the stations in the selected region')
+    col1, col2, col3, col4 = st.columns(4)
+    region = col1.selectbox('Region', list(STATION_REGIONS))
+    (south, west, north, east), region_zoom = STATION_REGIONS[region]
+    # The map is drawn around the chosen center and zoom; only the stations visible there are sent to the browser
+    center_lat = col2.slider('Latitude', south, north, value=(south + north) / 2)
+    center_lon = col3.slider('Longitude', west, east, value=(west + east) / 2)
+    zoom = col4.slider('Zoom', 1, 12, value=region_zoom)
+
+    df_stations = fetch_stations_data((south, west, north, east))
+    if df_stations.empty:
+        st.warning(f"No stations available for the selected region: {region}")
+    else:
+        display_stations_deck_map(df_stations, (center_lat, center_lon), zoom)
+    report_render_profile("Stations")
+
+if selected == "Stations":
+    stations_page()
+
 # Setting up the About page
 if selected=='About':
     # The "API reference" section provides a layout with three columns to show the source, description, and link for each data source.
@@ -0,0 +1,109 @@
+# The implementations which the benchmarks compare the app with: the original code of aqifinal3.py (before the backlog changes),
+# copied without the HTTP requests, so that only the processing of a WAQI response is timed.
+import pandas as pd
+
+
+# The original recursive flattener of the WAQI response
+def flatten_dict(d, parent_key='', sep='_', exclude_keys=None):
+    if exclude_keys is None:
+        exclude_keys = []
+    items = []
+    if isinstance(d, dict):
+        # k - key
+        # v - value
+        for k, v in d.items():
+            new_key = f'{parent_key}{sep}{k}' if parent_key else k
+            # - It checks if the current value (v) is a dictionary. If so, it recursively calls flatten_dict on the nested dictionary.
+            if isinstance(v, dict):
+                items.extend(flatten_dict(v, new_key, sep=sep, exclude_keys=exclude_keys).items())
+            # - If the value is not a dictionary, it appends a key-value pair to the items list. 
+            # - If the key is not in the exclude_keys, it appends the pair; otherwise, it is skipped.
+            elif new_key not in exclude_keys:
+                items.append((new_key, v))
+    else:
+        # Handling the case where the value is a string (or another non-dictionary type)
+        items.append((parent_key, d))
+    return dict(items)
+
+
+# The original processing of a /feed/{city}/ response in fetch_air_quality_data(): flatten_dict + a one-row DataFrame + rename + drop
+def build_air_quality_frame(selected_location, result, columns_to_exclude=None):
+    data_list = []
+    if result:
+        flat_data = flatten_dict(result['data'], exclude_keys=['city_location', 'forecast_daily_uvi', 'city_name', 'attributions', 'city_url', 'time_v',
+                                                                'debug_sync', 'time_tz', 'time_iso', 'forecast_daily_o3', 'forecast_daily_pm10', 'forecast_daily_pm25'])
+        data_list.append({"city": selected_location, **flat_data})
+
+    df_all = pd.DataFrame(data_list)
+    df_all['city'] = df_all['city'].astype(str)
+    df_all.set_index('city', inplace=True)
+    df_all.rename(columns={'iaqi_co_v': 'Carbon_Monoxyde', 'iaqi_h_v': 'Relative_Humidity', 'iaqi_no2_v': 'Nitrogen_Dioxide', 'iaqi_o3_v': 'Ozone',
+                           'iaqi_p_v': 'Atmospheric_Pressure', 'iaqi_pm10_v': 'Particulate_Matter_(10µm)', 'iaqi_pm25_v': 'Particulate_Matter_(2.5µm)',
+                           'iaqi_so2_v': 'Sulphur_Dioxide', 'iaqi_t_v': 'Temperature', 'iaqi_w_v': 'Wind', 'iaqi_dew_v': 'Dew',
+                           'iaqi_r_v': 'Rain_(precipitation)', 'city_geo': 'Station_lat/long', 'time_s': 'Local_measurement_time',
+                           'dominentpol': 'Dominent_pollutant', 'idx': 'Station_id', 'aqi': 'AQI'}, inplace=True)
+    if columns_to_exclude:
+        columns_to_exclude = [col for col in columns_to_exclude if col in df_all.columns]
+        df_all = df_all.drop(columns=columns_to_exclude)
+    return df_all
+
+
+# The original scalar classifiers (if/elif chains)
+def get_air_quality_message(aqi_value):
+    if 0 <= aqi_value <= 50:
+        return "Air quality is good. The air pollution pose no threat. The conditions ideal for outdoor activities."
+    elif 51 <= aqi_value <= 100:
+        return "Air quality is moderate. The air pollution pose minimal risk to exposed persons. People with respiratory diseases should limit outdoor exertion."
+    elif 101 <= aqi_value <= 150:
+        return "Air quality may be unhealthy for certains groups. People with respiratory diseases should limit outdoor exertion."
+    elif 151 <= aqi_value <= 200:
+        return "Air quality is unhealty. The air pollution pose a threat for people at risk which may experience health effects. Other people should limit spending time outdoors, especially when they experience symptoms such as cough or sore throat."
+    elif 201 <= aqi_value <= 300:
+        return "Air quality is bad. People at risk should avoid going outside. The rest should limit outdoor activities."
+    elif aqi_value > 300:
+        return "The quality of air is dangerously wrong. Those at risk should avoid going outside. Others should limit the output to a minimum. All outdoor activities are discouraged."
+
+# Defining a function which assigns a color based on the Air Quality Index (AQI) value (for a more user-friendly, visual interface )  
+def get_air_quality_color(aqi_value):
+    if 0 <= aqi_value <= 50:
+        return "lightgreen"
+    elif 51 <= aqi_value <= 100:
+        return "yellow"
+    elif 101 <= aqi_value <= 150:
+        return "orange"
+    elif 151 <= aqi_value <= 200:
+        return "red"
+    elif 201 <= aqi_value <= 300:
+        return "lavender"
+    elif aqi_value > 300:
+        return "burlywood"
+
+
+# The original forecast: three DataFrames (o3, pm10, pm25) indexed by the city, prefixed and concatenated side by side
+def get_air_quality_forecast(city, response_data):
+    daily_forecast_data = response_data.get('data', {}).get('forecast', {}).get('daily', {})
+    o3_daily_forecast_df = pd.DataFrame(daily_forecast_data.get('o3', [{}]))
+    o3_daily_forecast_df['city'] = city
+    o3_daily_forecast_df.set_index('city', inplace=True)
+    pm10_daily_forecast_df = pd.DataFrame(daily_forecast_data.get('pm10', [{}]))
+    pm10_daily_forecast_df['city'] = city
+    pm10_daily_forecast_df.set_index('city', inplace=True)
+    pm25_daily_forecast_df = pd.DataFrame(daily_forecast_data.get('pm25', [{}]))
+    pm25_daily_forecast_df['city'] = city
+    pm25_daily_forecast_df.set_index('city', inplace=True)
+    return o3_daily_forecast_df, pm10_daily_forecast_df, pm25_daily_forecast_df
+
+
+def add_prefixes(df, prefix):
+    return df.rename(columns=lambda col: f"{prefix}_{col}")
+
+
+def fetch_air_quality_forecast(selected_location, response_data):
+    o3_df, pm10_df, pm25_df = get_air_quality_forecast(selected_location, response_data)
+    o3_df = add_prefixes(o3_df, 'o3')
+    pm10_df = add_prefixes(pm10_df, 'pm10')
+    pm25_df = add_prefixes(pm25_df, 'pm25')
+    o3_df['o3_city'] = selected_location
+    pm10_df['pm10_city'] = selected_location
+    pm25_df['pm25_city'] = selected_location
+    return pd.concat([o3_df, pm10_df, pm25_df], axis=1)
@@ -0,0 +1,65 @@
+# Benchmark of the "All cities" overview (user-004): fetching N cities one after another vs. fetch_all_cities_data() on a thread pool,
+# against the local stand-in server from waqi_replay.py with a simulated upstream latency.
+#   python bench/bench_all_cities.py --cities 17 50 --latency 0.2 --workers 8
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import feed_payload
+import waqi_replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, nargs="+", default=[17, 50])
+    parser.add_argument("--latency", type=float, default=0.2, help="mean upstream latency, in seconds")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    fixtures_dir = tempfile.mkdtemp()
+    server = waqi_replay.start_server(fixtures_dir, latency=args.latency)
+    base_url = f"http://127.0.0.1:{server.server_port}/"
+    rng = random.Random(0)
+    for i in range(max(args.cities)):
+        with open(waqi_replay.fixture_path(fixtures_dir, f"{base_url}feed/City{i}/"), "w") as f:
+            json.dump(feed_payload(i, rng), f)
+
+    # The app reads the base URL when it is imported; every city is fetched from the server (no cache hits between the runs)
+    os.environ["WAQI_BASE_URL"] = base_url
+    os.environ["WAQI_MAX_CONNECTIONS"] = str(args.workers)
+    from common import load_app
+    app = load_app()
+
+    def fresh_render():
+        app.get_feed_cache.clear()
+        app.city_feeds.clear()
+
+    def sequential(cities):
+        fresh_render()
+        return [app.get_city_feed(city) for city in cities]
+
+    def parallel(cities):
+        fresh_render()
+        return app.fetch_all_cities_data(cities, max_workers=args.workers)
+
+    print(f"Stand-in server latency {args.latency}s (x0.5-1.5), {args.workers} workers")
+    print(f"{'cities':>6s} {'sequential s':>13s} {'parallel s':>11s} {'speed-up':>9s}")
+    for n in args.cities:
+        cities = [f"City{i}" for i in range(n)]
+        parallel(cities)  # warm-up (connections, imports)
+        started = time.perf_counter()
+        sequential(cities)
+        sequential_time = time.perf_counter() - started
+        started = time.perf_counter()
+        frame = parallel(cities)
+        parallel_time = time.perf_counter() - started
+        assert len(frame) == n, f"only {len(frame)} of {n} cities answered"
+        print(f"{n:6d} {sequential_time:13.2f} {parallel_time:11.2f} {sequential_time / parallel_time:8.1f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
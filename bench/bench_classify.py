@@ -0,0 +1,41 @@
+# Benchmark of the AQI classification (user-008): the message and colour of --values AQI values,
+# by the original scalar if/elif functions (one call per value) vs. classify_air_quality() (one call for all the values).
+# It also checks that both give the same results for integer AQI values.
+#   python bench/bench_classify.py --values 1000000
+import argparse
+
+import numpy as np
+
+import baseline
+from common import best_time, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--values", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = load_app()
+    rng = np.random.default_rng(0)
+    integers = rng.integers(0, 500, args.values)
+    floats = rng.uniform(0, 500, args.values)
+
+    classified = app.classify_air_quality(integers)
+    sample = integers[:100000].tolist()
+    assert classified['Message'][:100000].tolist() == [baseline.get_air_quality_message(value) for value in sample]
+    assert classified['Color'][:100000].tolist() == [baseline.get_air_quality_color(value) for value in sample]
+    unclassified = sum(baseline.get_air_quality_color(value) is None for value in floats[:100000].tolist())
+
+    print(f"{args.values} AQI values")
+    for name, values in (("integers", integers), ("floats", floats)):
+        values_list = values.tolist()
+        before = best_time(lambda: ([baseline.get_air_quality_message(value) for value in values_list],
+                                    [baseline.get_air_quality_color(value) for value in values_list]), args.repeat)
+        after = best_time(lambda: app.classify_air_quality(values), args.repeat)
+        print(f"{name:8s} scalar functions: {before:6.3f} s   classify_air_quality: {after:6.3f} s   {before / after:5.0f}x")
+    print(f"results equal for integer values; the scalar functions leave {unclassified / 1000:.1f}% of the float values without a band")
+
+
+if __name__ == "__main__":
+    main()
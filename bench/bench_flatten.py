@@ -0,0 +1,51 @@
+# Benchmark of the flattening of WAQI responses into the air quality DataFrame (user-009), on --payloads synthetic /feed/{city}/ responses:
+# - one city at a time, as the City search page does: the original flatten_dict + DataFrame + rename + drop vs. build_air_quality_frame(),
+# - all at once: the original pipeline per response + pd.concat vs. one FeedFlattener call (as in fetch_all_cities_data()).
+# It also checks that both give the same values in the columns they share.
+#   python bench/bench_flatten.py --payloads 10000
+import argparse
+import random
+
+import pandas as pd
+
+import baseline
+from common import best_time, feed_payload, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--payloads", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = load_app()
+    rng = random.Random(0)
+    payloads = [feed_payload(i, rng) for i in range(args.payloads)]
+    cities = [f"City{i}" for i in range(args.payloads)]
+
+    before = pd.concat([baseline.build_air_quality_frame(city, payload) for city, payload in zip(cities, payloads)])
+    after = app.FeedFlattener(app.AIR_QUALITY_SCHEMA)(cities, payloads)
+    shared = [column for column in after.columns if column in before.columns]
+    pd.testing.assert_frame_equal(before[shared], after[shared], check_dtype=False)
+
+    def one_by_one(build):
+        return lambda: [build(city, payload) for city, payload in zip(cities, payloads)]
+
+    def all_at_once_before():
+        return pd.concat([baseline.build_air_quality_frame(city, payload) for city, payload in zip(cities, payloads)])
+
+    def all_at_once_after():
+        return app.FeedFlattener(app.AIR_QUALITY_SCHEMA)(cities, payloads)
+
+    print(f"{args.payloads} payloads, {len(shared)} shared columns with equal values")
+    rows = [("one city at a time", one_by_one(baseline.build_air_quality_frame), one_by_one(app.build_air_quality_frame)),
+            ("all at once", all_at_once_before, all_at_once_after)]
+    for name, before_run, after_run in rows:
+        before_time = best_time(before_run, args.repeat)
+        after_time = best_time(after_run, args.repeat)
+        print(f"{name:20s} flatten_dict + rename + drop: {before_time:7.3f} s ({before_time / args.payloads * 1e6:6.0f} µs/payload)   "
+              f"FeedFlattener: {after_time:7.3f} s ({after_time / args.payloads * 1e6:6.0f} µs/payload)   {before_time / after_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Benchmark of the forecast pipeline (user-015) across --cities synthetic /feed/{city}/ responses (o3, pm10, pm25 and uvi, 5 days each):
+# the original three prefixed DataFrames + pd.concat (bench/baseline.py) vs. build_forecast_frame() + pivot_forecast_frame(), one city at a time.
+# With --shift, pm10 is forecast one day later than the other pollutants; the script then also counts the rows of the original table
+# in which the o3 and pm10 forecasts of different days ended up side by side.
+#   python bench/bench_forecast.py --cities 1000
+import argparse
+import random
+
+import baseline
+from common import best_time, feed_payload, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cities", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    app = load_app()
+    rng = random.Random(0)
+    cities = [f"City{i}" for i in range(args.cities)]
+    aligned = [feed_payload(i, rng) for i in range(args.cities)]
+    shifted = [feed_payload(i, rng) for i in range(args.cities)]
+    for payload in shifted:
+        for forecast in payload["data"]["forecast"]["daily"]["pm10"]:
+            forecast["day"] = f"2026-10-{int(forecast['day'][-2:]) + 1}"
+
+    print(f"{args.cities} cities, 4 pollutants x 5 days")
+    for name, payloads in (("same days", aligned), ("pm10 shifted", shifted)):
+        before = best_time(lambda: [baseline.fetch_air_quality_forecast(city, payload) for city, payload in zip(cities, payloads)], args.repeat)
+        after = best_time(lambda: [app.pivot_forecast_frame(app.build_forecast_frame(payload)) for payload in payloads], args.repeat)
+        misaligned = sum((df["o3_day"] != df["pm10_day"]).sum() for df in
+                         (baseline.fetch_air_quality_forecast(city, payload) for city, payload in zip(cities[:100], payloads[:100])))
+        print(f"{name:13s} original: {before / args.cities * 1000:6.2f} ms/city   tidy + pivot: {after / args.cities * 1000:6.2f} ms/city   "
+              f"{before / after:4.1f}x   original rows mixing days (first 100 cities): {misaligned}")
+    tidy_only = best_time(lambda: [app.build_forecast_frame(payload) for payload in aligned], args.repeat)
+    print(f"build_forecast_frame alone (what the chart uses): {tidy_only / args.cities * 1000:.2f} ms/city")
+
+
+if __name__ == "__main__":
+    main()
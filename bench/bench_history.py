@@ -0,0 +1,105 @@
+# Benchmark of the SQLite history store (user-007): ingest rate, the latency of a single append (as done by every fetch),
+# the latency of the "last 7 days of a station" query and the time of a compaction (and of the appends made meanwhile), at millions of stored readings.
+# The readings are hourly readings of --stations stations, stored hour after hour (the order in which the app fetches them).
+#   python bench/bench_history.py --stations 1000 --rows 1000000 3000000
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from common import feed_payload, load_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 3000000], help="sizes of the store at which it is measured")
+    parser.add_argument("--batch", type=int, default=1000, help="readings appended in one transaction while filling the store")
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    app = load_app()
+    path = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    store = app.HistoryStore(path)
+    rng = random.Random(0)
+    template = feed_payload(0, rng)["data"]
+    hours = max(args.rows) // args.stations
+    first_hour = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+
+    # Returning the readings of every station in the given hour, as (city, WAQI response) pairs
+    def readings_of_hour(hour):
+        measured_at = (first_hour + timedelta(hours=hour)).strftime("%Y-%m-%d %H:%M:%S")
+        return [("City", {"status": "ok", "data": {**template, "idx": station_id, "aqi": rng.randint(1, 300),
+                                                   "time": {"s": measured_at, "tz": "+00:00"}}})
+                for station_id in range(args.stations)]
+
+    print(f"{args.stations} stations, hourly readings, batches of {args.batch}")
+    print(f"{'rows':>9s} {'ingest rows/s':>14s} {'append ms':>10s} {'query p50 ms':>13s} {'query p95 ms':>13s} {'file MB':>8s}")
+    hour, stored = 0, 0
+    for target in sorted(args.rows):
+        started, ingested = time.perf_counter(), 0
+        while stored + ingested < target:
+            readings = readings_of_hour(hour)
+            hour += 1
+            for start in range(0, len(readings), args.batch):
+                ingested += store.append(readings[start:start + args.batch])
+        ingest_rate = ingested / (time.perf_counter() - started)
+        stored += ingested
+
+        # One reading per append, like get_air_quality() does (the readings of the next hour, so that they are new)
+        single = readings_of_hour(hour)[:200]
+        hour += 1
+        started = time.perf_counter()
+        for one in single:
+            stored += store.append([one])
+        append_ms = (time.perf_counter() - started) / len(single) * 1000
+
+        latencies = []
+        for _ in range(args.queries):
+            started = time.perf_counter()
+            history = store.query(rng.randrange(args.stations), days=7)
+            latencies.append(time.perf_counter() - started)
+        assert len(history) >= 7 * 24
+        latencies.sort()
+        print(f"{stored:9d} {ingest_rate:14.0f} {append_ms:10.3f} {latencies[len(latencies) // 2] * 1000:13.2f} "
+              f"{latencies[int(len(latencies) * 0.95)] * 1000:13.2f} {os.path.getsize(path) / 2 ** 20:8.0f}")
+
+    # Compacting with nothing to remove, then removing the oldest ~10% of the readings on a connection of its own (like the compactor thread)
+    # while single readings are appended with the short busy timeout of the renders, to see how long an append waits for the compaction
+    started = time.perf_counter()
+    removed = store.compact(hours // 24 + 2)
+    print(f"compact(keep_days={hours // 24 + 2}): removed {removed} readings in {time.perf_counter() - started:.2f} s")
+    keep_days = int(hours * 0.9 / 24)
+    renders = app.HistoryStore(path, busy_timeout=app.WAQI_HISTORY_BUSY_TIMEOUT)
+    compaction = {}
+
+    def compact():
+        started = time.perf_counter()
+        compaction["removed"] = app.HistoryStore(path).compact(keep_days)
+        compaction["seconds"] = time.perf_counter() - started
+
+    compactor = threading.Thread(target=compact)
+    compactor.start()
+    latencies, failed = [], 0
+    while compactor.is_alive():
+        for one in readings_of_hour(hour)[:50]:
+            started = time.perf_counter()
+            try:
+                renders.append([one])
+            except sqlite3.OperationalError:
+                failed += 1
+            latencies.append(time.perf_counter() - started)
+        hour += 1
+    compactor.join()
+    latencies.sort()
+    print(f"compact(keep_days={keep_days}): removed {compaction['removed']} readings in {compaction['seconds']:.2f} s, "
+          f"file {os.path.getsize(path) / 2 ** 20:.0f} MB")
+    print(f"  {len(latencies)} appends meanwhile: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms, {failed} given up after {app.WAQI_HISTORY_BUSY_TIMEOUT} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Benchmark of the WAQI HTTP client (user-003): per-request latency with and without connection pooling,
+# against the local stand-in server from waqi_replay.py (plain HTTP, so the pool saves the TCP handshake only; over TLS the difference is bigger).
+#   python bench/bench_pooling.py --requests 500 --threads 1 4 8
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import load_app
+import waqi_replay
+
+
+# Sending `count` requests with send(url) from `threads` threads; returning the latencies (in seconds) and the wall-clock time
+def run(send, url, count, threads):
+    def timed_request(_):
+        started = time.perf_counter()
+        response = send(url)
+        assert response.status_code == 200
+        return time.perf_counter() - started
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        latencies = sorted(executor.map(timed_request, range(count)))
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    app = load_app()
+    fixtures_dir = tempfile.mkdtemp()
+    server = waqi_replay.start_server(fixtures_dir)
+    url = f"http://127.0.0.1:{server.server_port}/feed/Lodz/?token=bench"
+    with open(waqi_replay.fixture_path(fixtures_dir, url), "w") as f:
+        json.dump({"status": "ok", "data": {"aqi": 42, "idx": 1}}, f)
+
+    clients = {
+        "requests.get (new connection)": lambda url: requests.get(url, timeout=(3.05, 10)),
+        "WaqiClient (pooled)": app.WaqiClient(3.05, 10, 2, max(args.threads)).get,
+    }
+    print(f"{args.requests} requests to the stand-in server at {url.split('feed')[0]}")
+    print(f"{'client':32s} {'threads':>7s} {'p50 ms':>8s} {'p95 ms':>8s} {'mean ms':>8s} {'req/s':>8s}")
+    for threads in args.threads:
+        for name, send in clients.items():
+            run(send, url, 20, threads)  # warm-up
+            latencies, elapsed = run(send, url, args.requests, threads)
+            print(f"{name:32s} {threads:7d} {latencies[len(latencies) // 2] * 1000:8.2f} {latencies[int(len(latencies) * 0.95)] * 1000:8.2f} "
+                  f"{statistics.mean(latencies) * 1000:8.2f} {args.requests / elapsed:8.0f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
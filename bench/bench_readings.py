@@ -0,0 +1,76 @@
+# Benchmark of the in-memory station readings (user-018): memory per station and construction time at --stations stations,
+# for the DataFrame-per-city approach (the original pipeline in bench/baseline.py, and the current FeedFlattener one)
+# vs. the reading records (build_readings(), one feed at a time and in one batch, ReadingTable, and records from one map response).
+# The time is measured without tracemalloc, the memory (what the result keeps alive) with it.
+# Building a DataFrame per city takes about 1 ms, so above --frame-sample stations the frames are measured on a sample and extrapolated.
+#   python bench/bench_readings.py --stations 10000 100000
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+import baseline
+from common import feed_payload, load_app, map_stations
+
+
+# Returning the time of build(items) and the memory (in bytes) kept by its result
+def measure(build, items):
+    gc.collect()
+    started = time.perf_counter()
+    result = build(items)
+    elapsed = time.perf_counter() - started
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = build(items)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--frame-sample", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = load_app()
+    flattener = app.FeedFlattener(app.AIR_QUALITY_SCHEMA)
+
+    def reading_table(payloads):
+        table = app.ReadingTable()
+        table.update(app.build_readings(payloads))
+        return table
+
+    methods = [
+        ("raw payload dicts", lambda payloads: json.loads(json.dumps(payloads)), "feeds"),
+        ("DataFrame per city (original)", lambda payloads: [baseline.build_air_quality_frame(f"City{i}", payload) for i, payload in enumerate(payloads)], "frames"),
+        ("DataFrame per city (FeedFlattener)", lambda payloads: [flattener([f"City{i}"], [payload]) for i, payload in enumerate(payloads)], "frames"),
+        ("records, one feed at a time", lambda payloads: np.concatenate([app.build_readings([payload]) for payload in payloads]), "feeds"),
+        ("records, one batch", app.build_readings, "feeds"),
+        ("ReadingTable (incl. id -> row)", reading_table, "feeds"),
+        ("records from one map response", lambda stations: app.build_readings([{"status": "ok", "data": stations}]), "map"),
+    ]
+    print(f"reading record: {app.READING_DTYPE.itemsize} bytes")
+    print(f"{'stations':>8s} {'method':36s} {'B/station':>10s} {'time s':>8s}")
+    for n in args.stations:
+        rng = random.Random(n)
+        payloads = [feed_payload(i, rng) for i in range(n)]
+        stations = map_stations(n, rng=rng)
+        for name, build, kind in methods:
+            items = stations if kind == "map" else payloads
+            sample = min(n, args.frame_sample) if kind == "frames" else n
+            elapsed, size = measure(build, items[:sample])
+            note = f"  (extrapolated from {sample})" if sample < n else ""
+            print(f"{n:8d} {name:36s} {size / sample:10.0f} {elapsed * n / sample:8.2f}{note}")
+        started = time.perf_counter()
+        app.readings_frame(app.build_readings(payloads))
+        print(f"{n:8d} {'readings_frame() incl. the records':36s} {'':>10s} {time.perf_counter() - started:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
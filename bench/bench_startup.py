@@ -0,0 +1,113 @@
+# Startup benchmark of every page (user-006): each page is rendered once with AppTest in a fresh Python process started with -X importtime,
+# which reports the time spent importing modules during the render, the wall-clock time of the render and the peak RSS of the process.
+# The WAQI responses come from the local stand-in server (waqi_replay.py), so the network isn't measured.
+# The script exits with 1 when a page exceeds the thresholds, or loads a module which only the other pages need (e.g. folium in Welcome):
+#   python bench/bench_startup.py --max-import-ms 1500 --max-rss-mb 300
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from common import REPO_DIR, feed_payload, map_stations
+import waqi_replay
+
+APP_PATH = os.path.join(REPO_DIR, "aqifinal3.py")
+PAGES = ["Welcome", "City search", "Stations", "About"]
+CITIES = ["Szczecin", "Bydgoszcz", "Torun", "Lublin", "Gorzow Wielkopolski", "Zielona Gora", "Lodz", "Krakow", "Wroclaw", "Opole",
+          "Rzeszow", "Bialystok", "Gdansk", "Katowice", "Kielce", "Poznan", "Warszawa"]
+STATION_REGIONS = [(49.0, 14.1, 54.9, 24.2), (35.0, -11.0, 71.0, 40.0), (-60.0, -180.0, 75.0, 180.0)]
+# Modules which a page must not load, because only the other pages use them (or nothing uses them any more)
+FORBIDDEN_MODULES = {
+    "Welcome": ["folium", "streamlit_folium", "plotly", "pydeck", "sklearn", "snowflake"],
+    "About": ["folium", "streamlit_folium", "plotly", "pydeck", "sklearn", "snowflake"],
+    "City search": ["sklearn", "snowflake"],
+    "Stations": ["folium", "streamlit_folium", "plotly", "sklearn", "snowflake"],
+}
+
+# Rendering one page in the child process; the markers on stderr separate the imports of the render from those of AppTest itself
+CHILD = """
+import json, resource, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+print("--- render", file=sys.stderr, flush=True)
+started = time.perf_counter()
+app.run()
+elapsed = time.perf_counter() - started
+print("--- done", file=sys.stderr, flush=True)
+print(json.dumps({"render_s": elapsed, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "exceptions": [str(e.value) for e in app.exception]}))
+"""
+
+
+# Returning the modules imported during the render, with their own import time (in microseconds), from the -X importtime output
+def render_imports(stderr):
+    imports, rendering = {}, False
+    for line in stderr.splitlines():
+        if line.startswith("--- "):
+            rendering = line == "--- render"
+        elif rendering and line.startswith("import time:") and "|" in line and "self [us]" not in line:
+            self_us, _, module = line[len("import time:"):].split("|")
+            imports[module.strip()] = int(self_us)
+    return imports
+
+
+def measure(page, base_url):
+    env = dict(os.environ, AQI_DEFAULT_PAGE=page, WAQI_BASE_URL=base_url, WAQI_HISTORY_DB="", AQI_PROFILE="0")
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, APP_PATH], cwd=REPO_DIR, env=env,
+                           capture_output=True, text=True, timeout=600)
+    if child.returncode != 0:
+        raise RuntimeError(f"{page}: the render failed\n{child.stderr[-2000:]}")
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    imports = render_imports(child.stderr)
+    result["import_ms"] = sum(imports.values()) / 1000
+    result["modules"] = len(imports)
+    result["forbidden"] = sorted({module.split(".")[0] for module in imports} & set(FORBIDDEN_MODULES[page]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", nargs="+", default=PAGES, choices=PAGES)
+    parser.add_argument("--max-import-ms", type=float, default=1500, help="the most time a page may spend importing modules")
+    parser.add_argument("--max-rss-mb", type=float, default=300, help="the most memory (peak RSS) the process rendering a page may use")
+    args = parser.parse_args()
+
+    fixtures_dir = tempfile.mkdtemp()
+    server = waqi_replay.start_server(fixtures_dir)
+    base_url = f"http://127.0.0.1:{server.server_port}/"
+    rng = random.Random(0)
+    for i, city in enumerate(CITIES):
+        payload = feed_payload(i, rng)
+        payload["data"]["city"]["name"] = city
+        with open(waqi_replay.fixture_path(fixtures_dir, f"{base_url}feed/{city}/"), "w") as f:
+            json.dump(payload, f)
+    for bounds in STATION_REGIONS:
+        with open(waqi_replay.fixture_path(fixtures_dir, f"{base_url}map/bounds/?latlng={','.join(str(value) for value in bounds)}"), "w") as f:
+            json.dump({"status": "ok", "data": map_stations(2000, bounds, rng)}, f)
+
+    failures = []
+    print(f"{'page':12s} {'imports ms':>10s} {'modules':>8s} {'render s':>9s} {'peak RSS MB':>12s}  unexpected modules")
+    for page in args.pages:
+        result = measure(page, base_url)
+        print(f"{page:12s} {result['import_ms']:10.0f} {result['modules']:8d} {result['render_s']:9.2f} {result['max_rss_mb']:12.0f}  "
+              f"{', '.join(result['forbidden']) or '-'}")
+        if result["exceptions"]:
+            failures.append(f"{page}: exceptions {result['exceptions']}")
+        if result["import_ms"] > args.max_import_ms:
+            failures.append(f"{page}: imports took {result['import_ms']:.0f} ms (limit {args.max_import_ms:.0f} ms)")
+        if result["max_rss_mb"] > args.max_rss_mb:
+            failures.append(f"{page}: peak RSS {result['max_rss_mb']:.0f} MB (limit {args.max_rss_mb:.0f} MB)")
+        if result["forbidden"]:
+            failures.append(f"{page}: loaded {', '.join(result['forbidden'])}")
+    server.shutdown()
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
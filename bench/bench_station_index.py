@@ -0,0 +1,84 @@
+# Benchmark of the station index (user-013) at --stations stations (half spread over the whole globe, half over Europe, where stations are dense):
+# - building the index, adding new stations to it and rebuilding it from the history store after a restart,
+# - the latency of nearest() and within(R km) at random points, vs. a brute-force haversine scan of all the stations with NumPy.
+# Every result is checked against the brute-force one.
+#   python bench/bench_station_index.py --stations 100000 --queries 1000
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import load_app
+
+
+# Returning n random points: half uniform on the sphere, half within Europe
+def random_points(rng, n):
+    world = n // 2
+    latitudes = np.concatenate([np.degrees(np.arcsin(rng.uniform(-1, 1, world))), rng.uniform(35, 71, n - world)])
+    longitudes = np.concatenate([rng.uniform(-180, 180, world), rng.uniform(-11, 40, n - world)])
+    return latitudes, longitudes
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1e6, latencies[int(len(latencies) * 0.95)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--radius", type=float, nargs="+", default=[25, 50, 500], help="radii (km) of the within() queries")
+    args = parser.parse_args()
+
+    app = load_app()
+    rng = np.random.default_rng(0)
+    latitudes, longitudes = random_points(rng, args.stations)
+    stations = [(station_id, f"Station {station_id}", float(latitude), float(longitude))
+                for station_id, (latitude, longitude) in enumerate(zip(latitudes, longitudes))]
+
+    index = app.StationIndex()
+    started = time.perf_counter()
+    index.add(stations)
+    print(f"{args.stations} stations: index built in {time.perf_counter() - started:.2f} s")
+    new_latitudes, new_longitudes = random_points(rng, 1000)
+    started = time.perf_counter()
+    index.add([(args.stations + i, None, float(latitude), float(longitude)) for i, (latitude, longitude) in enumerate(zip(new_latitudes, new_longitudes))])
+    print(f"1000 new stations added in {(time.perf_counter() - started) * 1000:.1f} ms")
+    latitudes, longitudes = np.concatenate([latitudes, new_latitudes]), np.concatenate([longitudes, new_longitudes])
+
+    # Rebuilding the index after a restart from the stations saved in the history store
+    store = app.HistoryStore(os.path.join(tempfile.mkdtemp(), "history.sqlite3"))
+    store.save_stations(stations)
+    started = time.perf_counter()
+    app.StationIndex().add(store.load_stations())
+    print(f"index rebuilt from the history store in {time.perf_counter() - started:.2f} s")
+
+    query_latitudes, query_longitudes = random_points(rng, args.queries)
+    queries = [("nearest", None)] + [(f"within {radius:g} km", radius) for radius in args.radius]
+    print(f"{'query':16s} {'index p50 µs':>13s} {'index p95 µs':>13s} {'brute p50 µs':>13s} {'brute p95 µs':>13s} {'found':>8s}")
+    for name, radius in queries:
+        index_latencies, brute_latencies, found = [], [], 0
+        for latitude, longitude in zip(query_latitudes, query_longitudes):
+            started = time.perf_counter()
+            result = index.nearest(latitude, longitude) if radius is None else index.within(latitude, longitude, radius)
+            index_latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            distances = app.haversine_km(latitude, longitude, latitudes, longitudes)
+            expected = [int(np.argmin(distances))] if radius is None else np.flatnonzero(distances <= radius)
+            brute_latencies.append(time.perf_counter() - started)
+
+            if radius is None:
+                assert np.isclose(result[0], distances[expected[0]])
+            else:
+                assert sorted(station[1] for station in result) == sorted(expected.tolist())
+            found += 1 if radius is None else len(result)
+        print(f"{name:16s} {percentiles(index_latencies)[0]:13.1f} {percentiles(index_latencies)[1]:13.1f} "
+              f"{percentiles(brute_latencies)[0]:13.1f} {percentiles(brute_latencies)[1]:13.1f} {found / args.queries:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Benchmark of the Stations map (user-012): the size of the map sent to the browser and the time the server needs to build it,
+# for --stations synthetic stations spread over Europe, seen at the zoom levels of a continent, a country and a city. Compared are:
+# - folium: one Folium marker per station (how the app drew stations before, see render_map_html()),
+# - pydeck, all stations: display_stations_deck_map() without culling or clustering (STATIONS_MAX_POINTS unlimited, the whole region in view),
+# - pydeck, culled + clustered: display_stations_deck_map() as the app runs it.
+# The pydeck sizes are those of the deck JSON passed to st.pydeck_chart(); the times include building it.
+#   python bench/bench_stations_map.py --stations 1000 10000 50000
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit
+
+from common import load_app, map_stations
+
+VIEWS = [("continent", (53.0, 14.5), 3), ("country", (52.0, 19.0), 6), ("city", (52.2, 21.0), 10)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--folium-max", type=int, default=50000, help="the most stations drawn with folium (about 1 s per 1000)")
+    args = parser.parse_args()
+
+    app = load_app()
+    # Keeping the deck passed to st.pydeck_chart(), to measure its JSON
+    decks = []
+    pydeck_chart = streamlit.pydeck_chart
+    streamlit.pydeck_chart = lambda deck, *args, **kwargs: (decks.append(deck), pydeck_chart(deck, *args, **kwargs))
+    max_points = app.STATIONS_MAX_POINTS
+
+    # Drawing the map with display_stations_deck_map(); returning the number of points, the size of the deck JSON (bytes) and the time
+    def deck_map(df_stations, center, zoom, points_limit):
+        app.STATIONS_MAX_POINTS = points_limit
+        decks.clear()
+        started = time.perf_counter()
+        app.display_stations_deck_map(df_stations, center, zoom)
+        elapsed = time.perf_counter() - started
+        app.STATIONS_MAX_POINTS = max_points
+        return app.render_metrics["map_points"], len(decks[0].to_json().encode()), elapsed
+
+    print(f"STATIONS_MAX_POINTS = {max_points}")
+    print(f"{'stations':>8s} {'view':10s} {'method':28s} {'points':>7s} {'size kB':>9s} {'time ms':>9s}")
+    for n in args.stations:
+        stations = map_stations(n, rng=random.Random(n))
+        df_stations = pd.DataFrame({"Station_id": [s["uid"] for s in stations], "Station_name": [s["station"]["name"] for s in stations],
+                                    "lat": [s["lat"] for s in stations], "lon": [s["lon"] for s in stations],
+                                    "AQI": pd.to_numeric(pd.Series([s["aqi"] for s in stations]), errors="coerce")})
+
+        if n <= args.folium_max:
+            colors = app.classify_air_quality(df_stations["AQI"])["Color"].astype(object).fillna("gray")
+            markers = tuple((row.lat, row.lon, f"<b>{row.Station_name}</b><br>AQI: {row.AQI}", color)
+                            for row, color in zip(df_stations.itertuples(), colors))
+            started = time.perf_counter()
+            html = app.render_map_html.__wrapped__(None, 6, markers)
+            print(f"{n:8d} {'any':10s} {'folium, every station':28s} {n:7d} {len(html.encode()) / 1024:9.0f} "
+                  f"{(time.perf_counter() - started) * 1000:9.0f}")
+
+        points, size, elapsed = deck_map(df_stations, VIEWS[0][1], VIEWS[0][2], np.iinfo(np.int64).max)
+        print(f"{n:8d} {'any':10s} {'pydeck, every station':28s} {points:7d} {size / 1024:9.0f} {elapsed * 1000:9.0f}")
+        for view, center, zoom in VIEWS:
+            points, size, elapsed = deck_map(df_stations, center, zoom, max_points)
+            print(f"{n:8d} {view:10s} {'pydeck, culled + clustered':28s} {points:7d} {size / 1024:9.0f} {elapsed * 1000:9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Shared helpers of the benchmark scripts in this directory (run them from the repository, e.g. python bench/bench_pooling.py):
+# - load_app() imports the app as a module (rendering the About page, which needs no network), so that its functions can be timed directly,
+# - feed_payload() and map_stations() build synthetic WAQI responses,
+# - best_time() times a function.
+import importlib
+import logging
+import os
+import random
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+POLLUTANTS = ["pm25", "pm10", "o3", "no2", "so2", "co"]
+IAQI_KEYS = ["co", "h", "no2", "o3", "p", "pm10", "pm25", "so2", "t", "w", "dew", "r", "wg"]
+
+
+# Importing the app (once) with the history store turned off
+def load_app():
+    os.environ.setdefault("AQI_DEFAULT_PAGE", "About")
+    os.environ.setdefault("WAQI_HISTORY_DB", "")
+    import streamlit  # noqa: F401 (the loggers below are created by streamlit)
+    # Hiding the warnings which streamlit logs outside `streamlit run` (with filters, since streamlit resets the log levels)
+    for name in ("streamlit.runtime.scriptrunner_utils.script_run_context", "streamlit.runtime.caching.cache_data_api", "streamlit"):
+        logging.getLogger(name).addFilter(lambda record: record.levelno > logging.WARNING)
+    cwd = os.getcwd()
+    os.chdir(REPO_DIR)
+    try:
+        return importlib.import_module("aqifinal3")
+    finally:
+        os.chdir(cwd)
+
+
+# Returning a synthetic /feed/{city}/ response of station number i (with a 5-day forecast of o3, pm10, pm25 and uvi)
+def feed_payload(i, rng=random):
+    days = [f"2026-10-{day}" for day in range(15, 20)]
+    return {
+        "status": "ok",
+        "data": {
+            "aqi": rng.randint(1, 300),
+            "idx": 1000 + i,
+            "dominentpol": rng.choice(POLLUTANTS),
+            "city": {"geo": [49 + 6 * rng.random(), 14 + 10 * rng.random()], "name": f"Station {i}", "url": "", "location": ""},
+            "iaqi": {key: {"v": round(100 * rng.random(), 1)} for key in IAQI_KEYS},
+            "time": {"s": "2026-10-17 12:00:00", "tz": "+02:00", "v": 1792238400, "iso": "2026-10-17T12:00:00+02:00"},
+            "forecast": {"daily": {pollutant: [{"avg": rng.randint(1, 80), "day": day, "max": 90, "min": 0} for day in days]
+                                   for pollutant in ("o3", "pm10", "pm25", "uvi")}},
+            "attributions": [{"url": "", "name": "GIOS"}],
+            "debug": {"sync": "2026-10-17T12:10:00+09:00"},
+        },
+    }
+
+
+# Returning n synthetic stations of a map/bounds response, spread over the given bounds (south, west, north, east)
+def map_stations(n, bounds=(35.0, -11.0, 71.0, 40.0), rng=random):
+    south, west, north, east = bounds
+    return [{"lat": rng.uniform(south, north), "lon": rng.uniform(west, east), "uid": i,
+             "aqi": rng.choice([str(rng.randint(1, 300))] * 9 + ["-"]),
+             "station": {"name": f"Station {i}", "time": "2026-10-17T12:00:00+02:00"}} for i in range(n)]
+
+
+# Returning the shortest time (in seconds) of `repeat` runs of function()
+def best_time(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
@@ -0,0 +1,122 @@
+# Load test of the City search page, run against recorded WAQI responses instead of the live API (see waqi_replay.py).
+#
+# 1. Record the fixtures once, by using the app with the live API in the "record" mode:
+#      WAQI_HTTP_MODE=record streamlit run aqifinal3.py
+#    (every city, custom city and station map shown is saved into waqi_fixtures/)
+# 2. Run the load test, e.g. 20 concurrent sessions, 10 city selections each, 300 ms upstream latency and 5% upstream errors:
+#      python loadtest.py --sessions 20 --interactions 10 --latency 0.3 --error-rate 0.05
+#
+# Every simulated session opens the City search page and then selects random cities from the list, one after another
+# (with Streamlit's AppTest, so every selection is a full rerun of the script, in the same process and with the same caches as the app).
+# The WAQI responses come either from a local stand-in server over HTTP (--transport server, the default) or from the replay adapter,
+# without sockets (--transport adapter). The test reports the throughput (selections per second) and the p50/p95/p99 latency of a selection.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from streamlit.testing.v1 import AppTest
+
+import waqi_replay
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aqifinal3.py")
+
+
+# Serializing the first run of every session: it compiles the script, and compiling in several threads at once isn't safe on every Python
+compile_lock = threading.Lock()
+
+
+# Defining one simulated session: opening the City search page (not measured) and selecting `interactions` random cities
+def run_session(interactions, timeout, latencies, errors, lock):
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    with compile_lock:
+        app.run()
+    if not app.selectbox:
+        print(f"Session error: the City search page didn't open {[e.value for e in app.exception]}")
+        with lock:
+            errors[0] += interactions
+        return
+    cities = [city for city in app.selectbox[0].options if city not in ("Custom", "All cities")]
+    for _ in range(interactions):
+        started = time.perf_counter()
+        try:
+            app.selectbox[0].set_value(random.choice(cities)).run()
+            failed = len(app.exception) > 0
+        except Exception as error:  # e.g. the rerun didn't finish within the timeout
+            print(f"Session error: {error}")
+            failed = True
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            errors[0] += failed
+
+
+# Returning the given percentile (0-100) of a sorted list of values
+def percentile(values, p):
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the City search page against recorded WAQI responses")
+    parser.add_argument("--fixtures", default="waqi_fixtures", help="directory with the recorded responses")
+    parser.add_argument("--transport", choices=["server", "adapter"], default="server")
+    parser.add_argument("--sessions", type=int, default=10, help="number of concurrent sessions")
+    parser.add_argument("--interactions", type=int, default=10, help="city selections per session")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean upstream latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream requests answered with 503")
+    parser.add_argument("--padding", type=int, default=0, help="bytes added to every upstream response")
+    parser.add_argument("--cache-ttl", type=int, default=None, help="override WAQI_CACHE_TTL (0 sends every selection upstream)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds a single rerun may take")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.fixtures) or not os.listdir(args.fixtures):
+        print(f"No fixtures in {args.fixtures}; every city will be answered as unknown (record them first, see the top of this file)")
+
+    # The app reads its settings from the environment on every rerun, so they are set before the first session starts
+    os.environ["AQI_DEFAULT_PAGE"] = "City search"
+    os.environ.setdefault("WAQI_HISTORY_DB", os.path.join(tempfile.mkdtemp(), "loadtest_history.sqlite3"))
+    if args.cache_ttl is not None:
+        os.environ["WAQI_CACHE_TTL"] = str(args.cache_ttl)
+        os.environ["WAQI_CACHE_STALE_TTL"] = "0"
+    server = None
+    if args.transport == "server":
+        server = waqi_replay.start_server(args.fixtures, latency=args.latency, error_rate=args.error_rate, padding=args.padding)
+        os.environ["WAQI_HTTP_MODE"] = "live"
+        os.environ["WAQI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/"
+    else:
+        os.environ["WAQI_HTTP_MODE"] = "replay"
+        os.environ["WAQI_FIXTURES_DIR"] = args.fixtures
+        os.environ["WAQI_REPLAY_LATENCY"] = str(args.latency)
+        os.environ["WAQI_REPLAY_ERROR_RATE"] = str(args.error_rate)
+        os.environ["WAQI_REPLAY_PADDING"] = str(args.padding)
+
+    latencies, errors, lock = [], [0], threading.Lock()
+    threads = [threading.Thread(target=run_session, args=(args.interactions, args.timeout, latencies, errors, lock))
+               for _ in range(args.sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if server:
+        server.shutdown()
+
+    if not latencies:
+        print("No selections were made")
+        return 1
+    latencies.sort()
+    print(f"{args.sessions} sessions x {args.interactions} selections ({args.transport}, latency {args.latency}s, "
+          f"error rate {args.error_rate}, padding {args.padding} B)")
+    print(f"selections: {len(latencies)}, failed: {errors[0]}, time: {elapsed:.1f}s, throughput: {len(latencies) / elapsed:.1f}/s")
+    print(f"latency p50: {percentile(latencies, 50) * 1000:.0f} ms, p95: {percentile(latencies, 95) * 1000:.0f} ms, "
+          f"p99: {percentile(latencies, 99) * 1000:.0f} ms, mean: {statistics.mean(latencies) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
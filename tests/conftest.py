@@ -0,0 +1,52 @@
+# Shared fixtures of the tests. The app is a Streamlit script (importing it renders a page), so:
+# - `app` imports it once as a module, rendering the About page (which needs no network), to test its functions directly,
+# - `stand_in` starts the stand-in WAQI server from waqi_replay.py, serving the responses added by the test, for AppTest runs of whole pages.
+# Run the tests from the repository with: python -m pytest
+import importlib
+import json
+import os
+import sys
+
+import pytest
+import streamlit as st
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_DIR, "aqifinal3.py")
+sys.path.insert(0, REPO_DIR)
+
+import waqi_replay  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("AQI_DEFAULT_PAGE", "About")
+        monkeypatch.setenv("WAQI_HISTORY_DB", "")
+        monkeypatch.chdir(REPO_DIR)
+        return importlib.import_module("aqifinal3")
+
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    fixtures_dir = tmp_path / "fixtures"
+    fixtures_dir.mkdir()
+    server = waqi_replay.start_server(str(fixtures_dir))
+    base_url = f"http://127.0.0.1:{server.server_port}/"
+
+    # Saving the response to the given endpoint (e.g. "feed/Lodz/") as a fixture served by the stand-in server
+    def add_response(endpoint, payload):
+        with open(waqi_replay.fixture_path(str(fixtures_dir), base_url + endpoint), "w") as f:
+            json.dump(payload, f)
+    server.add_response = add_response
+
+    # Every render asks the server (no feed cache hits) and nothing is written into a history file
+    monkeypatch.setenv("WAQI_BASE_URL", base_url)
+    monkeypatch.setenv("WAQI_HISTORY_DB", "")
+    monkeypatch.setenv("WAQI_CACHE_TTL", "0")
+    monkeypatch.setenv("WAQI_CACHE_STALE_TTL", "0")
+    monkeypatch.chdir(REPO_DIR)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    yield server
+    server.shutdown()
+    st.cache_resource.clear()
@@ -0,0 +1,25 @@
+# Synthetic WAQI responses used by the tests (shaped like the real /feed/{city}/ responses, with only the parts the app reads)
+
+
+# Returning a daily forecast entry of one pollutant
+def forecast_day(day, avg, minimum=None, maximum=None):
+    return {"avg": avg, "day": day, "max": avg + 5 if maximum is None else maximum, "min": avg - 5 if minimum is None else minimum}
+
+
+# Returning a /feed/{city}/ response of one station
+def feed_payload(city, station_id, aqi=42, latitude=52.0, longitude=21.0, daily=None):
+    if daily is None:
+        daily = {pollutant: [forecast_day(f"2026-10-{day}", 20 + day) for day in (16, 17, 18)] for pollutant in ("o3", "pm10", "pm25")}
+    return {
+        "status": "ok",
+        "data": {
+            "aqi": aqi,
+            "idx": station_id,
+            "dominentpol": "pm25",
+            "city": {"geo": [latitude, longitude], "name": city, "url": ""},
+            "iaqi": {"pm25": {"v": aqi}, "pm10": {"v": 12}, "o3": {"v": 30.5}, "h": {"v": 81}, "p": {"v": 1013.2},
+                     "t": {"v": 11.2}, "w": {"v": 2.5}, "wg": {"v": 4}},
+            "time": {"s": "2026-10-17 12:00:00", "tz": "+02:00", "v": 1792238400},
+            "forecast": {"daily": daily},
+        },
+    }
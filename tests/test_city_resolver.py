@@ -0,0 +1,64 @@
+# CityResolver: which names are remembered as unknown, what counts as an avoided request and how many names are kept
+
+
+def make_resolver(app, max_size=100, cached=()):
+    resolver = app.CityResolver(negative_ttl=600, threshold=0.5, max_size=max_size, is_cached=lambda city: city in cached)
+    resolver.add((city, city) for city in ["Lodz", "Krakow", "Warszawa"])
+    return resolver
+
+
+def test_only_unknown_stations_are_rejected(app, stand_in, monkeypatch):
+    monkeypatch.setattr(app, "WAQI_BASE_URL", f"http://127.0.0.1:{stand_in.server_port}/")
+    stand_in.add_response("feed/Busy/", {"status": "error", "data": "Over quota"})
+    stand_in.add_response("feed/Nowhere/", {"status": "error", "data": "Unknown station"})
+
+    assert app.get_air_quality("Busy") is None
+    assert app.get_air_quality("Nowhere") is None
+    resolver = app.get_city_resolver()
+    assert resolver.resolve("Busy") == ("Busy", None)
+    assert resolver.resolve("Nowhere")[0] is None
+    assert resolver.stats["rejected"] == 1
+
+
+def test_avoided_counts_only_requests_which_are_not_sent(app):
+    resolver = make_resolver(app, cached={"Warszawa"})
+    # Spelling variants share the cache key of the city, so the resolver doesn't save a request for them
+    assert resolver.resolve(" łódź ") == ("Lodz", None)
+    # A misspelling of a city which isn't cached is still requested (under the right name)
+    assert resolver.resolve("Krakoow")[0] == "Krakow"
+    assert resolver.stats["avoided"] == 0
+
+    # A misspelling of a cached city and a name which was rejected recently aren't requested at all
+    assert resolver.resolve("Warszwa")[0] == "Warszawa"
+    resolver.reject("Atlantis")
+    assert resolver.resolve("atlantis")[0] is None
+    assert resolver.stats["avoided"] == 2
+
+
+def test_custom_and_rejected_names_are_limited(app):
+    resolver = make_resolver(app, max_size=3)
+    resolver.add([("Gdynia", "Gdynia"), ("Sopot", "Sopot"), ("Hel", "Hel")], custom=True)
+    resolver.resolve("Gdynia")  # used recently, so it is kept
+    resolver.add([("Puck", "Puck")], custom=True)
+    assert resolver.resolve("Sopot") == ("Sopot", None)  # forgotten: passed to the API as entered
+    assert resolver.stats["passed"] == 1
+    assert set(resolver._custom) == {"gdynia", "hel", "puck"}
+    assert "sopot" not in resolver._known and all("sopot" not in names for names in resolver._trigrams.values())
+    assert resolver.resolve("Krakow") == ("Krakow", None)  # the cities from the list are never forgotten
+
+    for name in ["A1", "A2", "A3", "A4", "A5"]:
+        resolver.reject(name)
+    assert list(resolver._rejected) == ["a3", "a4", "a5"]
+
+
+def test_expired_rejections_are_dropped(app):
+    resolver = make_resolver(app)
+    resolver.negative_ttl = 0
+    resolver.reject("Atlantis")
+    resolver.reject("Mu")
+    assert not resolver._rejected
+    resolver.negative_ttl = 600
+    resolver.reject("Lemuria")
+    resolver._rejected["lemuria"] = 0  # expired
+    assert resolver.resolve("Lemuria") == ("Lemuria", None)
+    assert not resolver._rejected
@@ -0,0 +1,76 @@
+# FeedCache: callers waiting for a fetch which another caller started get the same result as that caller
+import threading
+import time
+
+
+# Waiting (at most 5 seconds) until the condition is true
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_waiters_get_the_result_of_the_fetch(app):
+    cache = app.FeedCache(ttl=0, stale_ttl=0, max_size=10)
+    cache.put("lodz", {"data": "expired"})
+    started, release = threading.Event(), threading.Event()
+
+    # The refresh of the expired entry fails (get_air_quality() returns None)
+    def failing_loader():
+        started.set()
+        release.wait(5)
+        return None
+
+    results = {}
+    fetching = threading.Thread(target=lambda: results.update(fetching=cache.get("lodz", failing_loader)))
+    fetching.start()
+    started.wait(5)
+    waiting = threading.Thread(target=lambda: results.update(waiting=cache.get("lodz", failing_loader)))
+    waiting.start()
+    wait_until(lambda: cache.stats["misses"] == 2)
+    release.set()
+    fetching.join(5)
+    waiting.join(5)
+
+    assert results == {"fetching": None, "waiting": None}
+
+
+def test_waiters_share_one_fetch(app):
+    cache = app.FeedCache(ttl=60, stale_ttl=0, max_size=10)
+    calls, release = [], threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return {"data": "fresh"}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("lodz", loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.stats["misses"] == 5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == [{"data": "fresh"}] * 5
+
+
+def test_stale_entries_are_refreshed_with_the_refresh_loader(app):
+    cache = app.FeedCache(ttl=0, stale_ttl=60, max_size=10)
+    cache.put("lodz", {"data": "stale"})
+    calls = []
+
+    # The render's loader counts a request of the render; the background refresh mustn't use it
+    def render_loader():
+        calls.append("render")
+        return {"data": "render"}
+
+    def refresh_loader():
+        calls.append("refresh")
+        return {"data": "fresh"}
+
+    assert cache.get("lodz", render_loader, refresh_loader) == {"data": "stale"}
+    wait_until(lambda: cache.stats["refreshes"] == 1 and not cache._loading)
+    assert calls == ["refresh"]
@@ -0,0 +1,40 @@
+# build_forecast_frame / pivot_forecast_frame: every pollutant keeps its own days, whichever days the API forecasts for it
+import datetime
+
+from payloads import feed_payload, forecast_day
+
+
+def test_pollutants_with_different_days_are_joined_on_the_date(app):
+    payload = feed_payload("Lodz", 1, daily={
+        "o3": [forecast_day("2026-10-15", 10), forecast_day("2026-10-16", 11), forecast_day("2026-10-17", 12)],
+        "pm10": [forecast_day("2026-10-17", 30), forecast_day("2026-10-18", 31)],
+        "uvi": [forecast_day("2026-10-16", 1, minimum=0, maximum=2)],
+    })
+    df_forecast = app.build_forecast_frame(payload)
+    assert len(df_forecast) == 6
+    assert list(df_forecast['pollutant'].cat.categories) == ["o3", "pm10", "uvi"]
+
+    df_table = app.pivot_forecast_frame(df_forecast)
+    days = [datetime.date(2026, 10, day) for day in (15, 16, 17, 18)]
+    assert list(df_table.index) == days
+    assert list(df_table.columns) == ["o3_avg", "o3_max", "o3_min", "pm10_avg", "pm10_max", "pm10_min", "uvi_avg", "uvi_max", "uvi_min"]
+    assert df_table["o3_avg"].tolist()[:3] == [10, 11, 12]
+    assert df_table["pm10_avg"].isna().tolist() == [True, True, False, False]
+    assert df_table.loc[days[2], "pm10_avg"] == 30 and df_table.loc[days[3], "pm10_avg"] == 31
+    assert df_table.loc[days[1], ["uvi_avg", "uvi_max", "uvi_min"]].tolist() == [1, 2, 0]
+    assert df_table["uvi_avg"].notna().sum() == 1
+
+
+def test_repeated_days_keep_the_last_forecast(app):
+    payload = feed_payload("Lodz", 1, daily={"o3": [forecast_day("2026-10-16", 10), forecast_day("2026-10-16", 14)]})
+    assert app.build_forecast_frame(payload)["avg"].tolist() == [14]
+
+
+def test_empty_forecast(app):
+    for payload in (feed_payload("Lodz", 1, daily={}), {"status": "ok", "data": {"aqi": 42}}, None):
+        df_forecast = app.build_forecast_frame(payload)
+        assert df_forecast.empty
+        assert list(df_forecast.columns) == ["day", "pollutant", "avg", "min", "max"]
+        df_table = app.pivot_forecast_frame(df_forecast)
+        assert df_table.empty
+        assert df_table.index.name == "Date"
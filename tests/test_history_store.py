@@ -0,0 +1,97 @@
+# HistoryStore: readings are kept in local station time with their UTC offset, and compact() removes them by their UTC age
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from payloads import feed_payload
+
+
+# Returning a reading of a station measured `age` ago (in UTC) in the time zone `tz` (None when the API doesn't give one)
+def reading(station_id, age, tz):
+    measured_at = datetime.now(timezone.utc) - age
+    payload = feed_payload("Lodz", station_id)
+    if tz is None:
+        del payload["data"]["time"]["tz"]
+    else:
+        hours, minutes = tz[1:].split(":")
+        offset = (-1 if tz[0] == "-" else 1) * timedelta(hours=int(hours), minutes=int(minutes))
+        measured_at += offset
+        payload["data"]["time"]["tz"] = tz
+    payload["data"]["time"]["s"] = measured_at.strftime("%Y-%m-%d %H:%M:%S")
+    return "Lodz", payload
+
+
+def stored_stations(store):
+    return sorted(row[0] for row in store._connection.execute("SELECT station_id FROM readings"))
+
+
+def test_compact_compares_readings_in_utc(app, tmp_path):
+    store = app.HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.append([
+        reading(1, timedelta(days=1, minutes=30), "+14:00"),  # expired, although its local time is within the last day
+        reading(2, timedelta(days=1, minutes=-30), "-10:00"),  # still fresh, although its local time is older than a day
+        reading(3, timedelta(days=1, hours=6), None),  # no offset: kept until it is expired in every time zone
+        reading(4, timedelta(days=1, hours=13), None),
+    ])
+    assert store.compact(keep_days=1) == 2
+    assert stored_stations(store) == [2, 3]
+
+
+def test_compact_removes_old_readings_in_batches(app, tmp_path):
+    store = app.HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.append([reading(station_id, timedelta(days=3, hours=hours), "+02:00") for station_id in (1, 2) for hours in range(5)])
+    store.append([reading(1, timedelta(hours=1), "+02:00")])
+    statements = []
+    store._connection.set_trace_callback(statements.append)
+    assert store.compact(keep_days=1, batch_size=2) == 10
+    assert stored_stations(store) == [1]
+    # 5 old readings per station: two full batches and a last, partial one
+    assert sum(statement.startswith("DELETE") for statement in statements) == 6
+
+
+def test_compact_vacuums_incrementally_only_after_removing_readings(app, tmp_path):
+    store = app.HistoryStore(str(tmp_path / "history.sqlite3"))
+    assert store._connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    store.append([reading(1, timedelta(hours=1), "+02:00")])
+    statements = []
+    store._connection.set_trace_callback(statements.append)
+    assert store.compact(keep_days=1) == 0
+    assert not any("incremental_vacuum" in statement for statement in statements)
+
+    store.append([reading(station_id, timedelta(days=3), "+02:00") for station_id in range(2, 2000)])
+    assert store.compact(keep_days=1) == 1998
+    assert any("incremental_vacuum" in statement for statement in statements)
+    assert not any(statement.startswith("VACUUM") for statement in statements)
+    assert store._connection.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_append_gives_up_quickly_while_the_store_is_locked(app, tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    store = app.HistoryStore(path, busy_timeout=0.1)
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    started = time.monotonic()
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        store.append([reading(1, timedelta(hours=1), "+02:00")])
+    assert time.monotonic() - started < 1
+    writer.rollback()
+    assert store.append([reading(1, timedelta(hours=1), "+02:00")]) == 1
+
+
+def test_stores_created_without_the_utc_offset_are_migrated(app, tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.execute("""CREATE TABLE readings (station_id INTEGER NOT NULL, measured_at TEXT NOT NULL, city TEXT, lat REAL, lon REAL,
+                          aqi REAL, dominant_pollutant TEXT, co REAL, h REAL, no2 REAL, o3 REAL, p REAL, pm10 REAL, pm25 REAL,
+                          so2 REAL, t REAL, w REAL, dew REAL, r REAL, PRIMARY KEY (station_id, measured_at)) WITHOUT ROWID""")
+    connection.execute("INSERT INTO readings (station_id, measured_at, aqi) VALUES (1, '2026-10-16 12:00:00', 40)")
+    connection.commit()
+    connection.close()
+
+    store = app.HistoryStore(path)
+    assert store.append([reading(1, timedelta(hours=1), "+02:00")]) == 1
+    history = store.query(1, days=7)
+    assert history["UTC_offset_(min)"].tolist()[-1] == 120
+    assert len(history) == 2
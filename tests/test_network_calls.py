@@ -0,0 +1,36 @@
+# The City search page builds the current conditions and the forecast of a city from one /feed/{city}/ response,
+# so every render has to send exactly one request per city shown (checked at the stand-in server and in the render profile)
+import json
+
+from streamlit.testing.v1 import AppTest
+
+from conftest import APP_PATH
+from payloads import feed_payload
+
+
+def test_one_request_per_city(stand_in, tmp_path, monkeypatch):
+    profile_log = tmp_path / "profile.jsonl"
+    monkeypatch.setenv("AQI_DEFAULT_PAGE", "City search")
+    monkeypatch.setenv("AQI_PROFILE_LOG", str(profile_log))
+
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.run()
+    cities = [city for city in app.selectbox[0].options if city not in ("Custom", "All cities")]
+    for station_id, city in enumerate(cities, start=1000):
+        stand_in.add_response(f"feed/{city}/", feed_payload(city, station_id))
+
+    for city in ["Lodz", "Krakow", "Lodz"]:
+        stand_in.hits.clear()
+        app.selectbox[0].set_value(city).run()
+        assert not app.exception
+        assert len(app.dataframe) >= 2  # the current conditions and the forecast
+        assert stand_in.hits == {f"feed/{city}": 1}
+
+    stand_in.hits.clear()
+    app.selectbox[0].set_value("All cities").run()
+    assert not app.exception
+    assert stand_in.hits == {f"feed/{city}": 1 for city in cities}
+
+    profiles = [json.loads(line) for line in profile_log.read_text().splitlines()]
+    assert [profile["network_calls"] for profile in profiles[1:]] == [1, 1, 1, len(cities)]
+    assert all(profile["network_calls"] == profile["cities"] for profile in profiles)
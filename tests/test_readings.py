@@ -0,0 +1,23 @@
+# build_readings / ReadingTable: a malformed measurement time only affects its own reading and never replaces a newer one
+import numpy as np
+
+
+def map_station(uid, time):
+    return {"uid": uid, "lat": 52.0, "lon": 21.0, "aqi": "42", "station": {"name": f"Station {uid}", "time": time}}
+
+
+def test_malformed_times_are_parsed_one_by_one(app):
+    records = app.build_readings([{"status": "ok", "data": [
+        map_station(1, "2026-10-17T12:00:00+02:00"), map_station(2, "yesterday"), map_station(3, None)]}])
+    assert records['measured_at'].tolist()[0] == np.datetime64("2026-10-17T12:00:00").item()
+    assert np.isnat(records['measured_at'][1:]).all()
+
+
+def test_readings_without_a_time_do_not_replace_dated_ones(app):
+    table = app.ReadingTable()
+    table.update(app.build_readings([{"status": "ok", "data": [map_station(1, "2026-10-17T12:00:00+02:00")]}]))
+    table.update(app.build_readings([{"status": "ok", "data": [map_station(1, "soon")]}]))
+    assert table.lookup([1])['measured_at'][0] == np.datetime64("2026-10-17T12:00:00")
+
+    table.update(app.build_readings([{"status": "ok", "data": [map_station(1, "2026-10-17T13:00:00+02:00")]}]))
+    assert table.lookup([1])['measured_at'][0] == np.datetime64("2026-10-17T13:00:00")
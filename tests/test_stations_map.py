@@ -0,0 +1,23 @@
+# aggregate_stations: stations are merged into only as few points as needed to fit max_points
+import numpy as np
+import pandas as pd
+
+
+def stations_over_poland(count):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({'Station_name': [f"Station {i}" for i in range(count)], 'lat': rng.uniform(49.0, 54.8, count),
+                         'lon': rng.uniform(14.1, 24.1, count), 'AQI': rng.integers(1, 300, count)})
+
+
+def test_clusters_only_as_much_as_max_points_needs(app):
+    df_stations = stations_over_poland(3000)
+    for zoom in (5, 6):
+        df_points = app.aggregate_stations(df_stations, app.get_viewport((52.0, 19.0), zoom), max_points=2000)
+        assert 1800 <= len(df_points) <= 2000
+        assert df_points['Stations'].sum() == 3000
+
+
+def test_stations_are_not_clustered_when_they_fit(app):
+    df_points = app.aggregate_stations(stations_over_poland(500), app.get_viewport((52.0, 19.0), 5), max_points=2000)
+    assert len(df_points) == 500
+    assert (df_points['Stations'] == 1).all()
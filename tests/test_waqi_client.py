@@ -0,0 +1,55 @@
+# WaqiClient: retries of 429/5xx responses and the retry budget
+import requests
+from requests.adapters import BaseAdapter
+
+
+# Defining a transport adapter which answers every request with the next status from the given list (the last one is repeated)
+class StatusAdapter(BaseAdapter):
+    def __init__(self, statuses):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.requests = 0
+
+    def send(self, request, **kwargs):
+        self.requests += 1
+        response = requests.Response()
+        response.status_code = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        response._content = b"{}"
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def make_client(app, monkeypatch, statuses, max_retries=2):
+    adapter = StatusAdapter(statuses)
+    client = app.WaqiClient(1, 1, max_retries, 4, adapter)
+    monkeypatch.setattr(client, "_backoff", lambda attempt, response: 0)
+    return client, adapter
+
+
+def test_retries_until_success(app, monkeypatch):
+    client, adapter = make_client(app, monkeypatch, [503, 429, 200])
+    assert client.get("http://waqi.test/feed/Lodz/").status_code == 200
+    assert adapter.requests == 3
+
+
+def test_retry_budget_refills_with_successful_requests(app, monkeypatch):
+    client, adapter = make_client(app, monkeypatch, [503])
+    # A long outage uses up the budget: afterwards requests aren't retried any more
+    for _ in range(20):
+        client.get("http://waqi.test/feed/Lodz/")
+    adapter.requests = 0
+    client.get("http://waqi.test/feed/Lodz/")
+    assert adapter.requests == 1
+
+    # 100 successful requests put 10 retries back into the budget, so the next outage is retried max_retries times again
+    adapter.statuses = [200]
+    for _ in range(100):
+        client.get("http://waqi.test/feed/Lodz/")
+    adapter.statuses = [503]
+    adapter.requests = 0
+    for _ in range(3):
+        client.get("http://waqi.test/feed/Lodz/")
+    assert adapter.requests == 3 * 3
@@ -0,0 +1,162 @@
+# Record/replay support for the World Air Quality Index (WAQI) API, used to run and load test the app without the live API (see loadtest.py):
+# - RecordingAdapter saves every successful WAQI response into a fixtures directory (one JSON file per request, without the token),
+# - ReplayAdapter answers the app's requests from the fixtures directory, in-process, instead of sending them over the network,
+# - start_server() starts a local stand-in for the WAQI API which serves the same fixtures over HTTP.
+# Replayed responses can be slowed down (latency, in seconds), made to fail with 503 (error_rate, 0-1)
+# and made bigger (padding, the number of bytes added to every response).
+# Requests without a fixture are answered like the API answers unknown cities.
+#
+# The stand-in server can also be started on its own, e.g. to point the app at it with WAQI_BASE_URL:
+#   python waqi_replay.py --fixtures waqi_fixtures --port 8090 --latency 0.2 --error-rate 0.05
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+UNKNOWN_STATION = {"status": "error", "data": "Unknown station"}
+SERVICE_UNAVAILABLE = {"status": "error", "data": "Service unavailable (replay)"}
+
+
+# Defining a function which returns the key of a request: its path and query without the token (e.g. "feed/Lodz" or "map/bounds?latlng=...")
+def fixture_key(url):
+    parts = urlsplit(url)
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query) if key != 'token'))
+    return unquote(parts.path).strip('/') + (f"?{query}" if query else "")
+
+
+# Defining a function which returns the path of the fixture file of a request (the token is left out, so recordings can be shared)
+def fixture_path(fixtures_dir, url):
+    key = fixture_key(url)
+    slug = re.sub(r'[^A-Za-z0-9.-]+', '_', key).strip('_')[:80]
+    return os.path.join(fixtures_dir, f"{slug}-{hashlib.sha1(key.encode()).hexdigest()[:8]}.json")
+
+
+# Defining the behaviour of replayed responses (shared by ReplayAdapter and the stand-in server)
+class ReplayProfile:
+    def __init__(self, fixtures_dir, latency=0.0, error_rate=0.0, padding=0):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.error_rate = error_rate
+        self.padding = padding
+
+    # Returning the HTTP status and the body of the response to the given URL
+    def respond(self, url):
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.error_rate:
+            return 503, json.dumps(SERVICE_UNAVAILABLE).encode()
+        try:
+            with open(fixture_path(self.fixtures_dir, url), "rb") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            payload = UNKNOWN_STATION
+        if self.padding:
+            payload = {**payload, "padding": "x" * self.padding}
+        return 200, json.dumps(payload).encode()
+
+
+# Defining a transport adapter for requests which answers from the fixtures instead of the network
+class ReplayAdapter(BaseAdapter):
+    def __init__(self, fixtures_dir, latency=0.0, error_rate=0.0, padding=0):
+        super().__init__()
+        self.profile = ReplayProfile(fixtures_dir, latency, error_rate, padding)
+
+    def send(self, request, **kwargs):
+        status, body = self.profile.respond(request.url)
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK" if status == 200 else "Service Unavailable"
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response._content = body
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+# Defining a transport adapter for requests which sends the requests as usual and saves every successful WAQI response as a fixture
+class RecordingAdapter(HTTPAdapter):
+    def __init__(self, fixtures_dir, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(fixtures_dir, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200:
+            try:
+                payload = response.json()
+            except ValueError:
+                return response
+            if isinstance(payload, dict) and payload.get('status') == 'ok':
+                path = fixture_path(self.fixtures_dir, request.url)
+                # Writing to a temporary file first, so that a replay never reads a half-written fixture
+                temporary_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temporary_path, "w") as f:
+                    json.dump(payload, f)
+                os.replace(temporary_path, path)
+        return response
+
+
+# Starting the stand-in WAQI server in a background thread; the server (and its port: server.server_port) is returned, server.shutdown() stops it.
+# server.hits counts the requests received for every request key (see fixture_key()), e.g. to check how many requests a page sent.
+def start_server(fixtures_dir, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, padding=0):
+    profile = ReplayProfile(fixtures_dir, latency, error_rate, padding)
+    hits_lock = threading.Lock()
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        # Keeping the connections open between requests, like the real API does
+        protocol_version = "HTTP/1.1"
+        # Sending the headers and the body without waiting for an ACK in between (which takes ~40 ms on a kept-alive connection)
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            with hits_lock:
+                server.hits[fixture_key(self.path)] += 1
+            status, body = profile.respond(self.path)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.hits = Counter()
+    threading.Thread(target=server.serve_forever, name="waqi-stand-in", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the WAQI API serving recorded responses")
+    parser.add_argument("--fixtures", default="waqi_fixtures", help="directory with the recorded responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean latency of a response, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--padding", type=int, default=0, help="bytes added to every response")
+    args = parser.parse_args()
+
+    server = start_server(args.fixtures, args.host, args.port, args.latency, args.error_rate, args.padding)
+    print(f"Serving {args.fixtures} at http://{args.host}:{server.server_port}/ (use it as WAQI_BASE_URL)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()